@@ -4,23 +4,43 @@ import io
 import sys
 import json
 import re
-from typing import Optional, Tuple, List, Dict, Any, Union
+import math
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Optional, Tuple, List, Dict, Any, Union, Iterable, Iterator
 
 # Required libraries (ensure they are installed via requirements.txt)
 import fitz  # PyMuPDF
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
 from dotenv import load_dotenv
 from docx import Document
 from docx.shared import Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from google.api_core import exceptions as google_exceptions
+from cachetools import LRUCache
 
 # =========================
 # Setup (MODIFIED FOR FALLBACK)
 # =========================
 
+logger = logging.getLogger(__name__)
+
 API_KEYS = []
 MODEL_NAME = "gemini-1.5-flash-latest"
+# Lighter model for trivial extraction sub-tasks (e.g. job role inference) where quality is uncritical.
+SMALL_MODEL_NAME = "gemini-1.5-flash-8b"
+
+# Bound every Gemini request so a hung call can't hold a worker indefinitely.
+GEMINI_TIMEOUT_SECONDS = 30
+GEMINI_MAX_ATTEMPTS = 3  # per API key, for timeouts / 503s only
+GEMINI_RETRY_MAX_DELAY = 8
+# Overall budget for one call across all keys and retries, as a multiple of the per-request timeout.
+GEMINI_DEADLINE_FACTOR = 2
 
 def setup_api_keys():
     """Loads all available Gemini API keys from environment variables."""
@@ -48,41 +68,157 @@ def setup_api_keys():
 # Initialize the keys when the module is loaded
 setup_api_keys()
 
+# One client per API key, created on first use. genai.configure() swaps a process-global client,
+# so calling it per attempt from many threadpool threads lets one call switch another's key mid-flight.
+_key_clients: Dict[int, "glm.GenerativeServiceClient"] = {}
+_key_clients_lock = threading.Lock()
+
+def _client_for_key(index: int) -> "glm.GenerativeServiceClient":
+    with _key_clients_lock:
+        client = _key_clients.get(index)
+        if client is None:
+            client = glm.GenerativeServiceClient(client_options={"api_key": API_KEYS[index]})
+            _key_clients[index] = client
+        return client
+
+def _model_for_key(index: int, model_name: str) -> genai.GenerativeModel:
+    """A GenerativeModel bound to API key #index instead of the global default client."""
+    model = genai.GenerativeModel(model_name)
+    model._client = _client_for_key(index) # The SDK only falls back to the global client when this is unset
+    return model
+
 # =========================
 # NEW: Central API Call Function with Fallback Logic
 # =========================
-def _call_gemini_with_fallback(prompt: str, is_chat: bool = False, history: List = None) -> Optional[Any]:
+# Single-flight registry: identical concurrent requests share one upstream call.
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+def _call_gemini_with_fallback(prompt: str, is_chat: bool = False, history: List = None, model_name: str = MODEL_NAME, timeout: float = GEMINI_TIMEOUT_SECONDS, temperature: Optional[float] = None) -> Optional[Any]:
     """
     Calls the Gemini API, automatically trying the next API key if the current one fails.
     Handles both standard generation and chat sessions.
+    `temperature` overrides the model default for standard generation (e.g. 0 for repeatable output).
+    Identical concurrent calls are coalesced: the first caller performs the request
+    and the others wait for (and share) its response.
+    """
+    key = hashlib.sha256(
+        json.dumps([model_name, is_chat, prompt, history, temperature], default=str).encode("utf-8")
+    ).hexdigest()
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not is_leader:
+        logger.debug("Identical Gemini request already in flight. Waiting for its result.")
+        return future.result()
+
+    try:
+        response = _call_gemini_uncoalesced(prompt, is_chat, history, model_name, timeout, temperature)
+        future.set_result(response)
+        return response
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+def _call_gemini_uncoalesced(prompt: str, is_chat: bool, history: Optional[List], model_name: str, timeout: float, temperature: Optional[float] = None) -> Optional[Any]:
+    """
+    Tries each API key in turn. Per key, a call is capped at `timeout` seconds and
+    timeouts / 503s are retried with exponential backoff (1s, 2s, 4s ... capped).
+    Any other error moves straight on to the next key.
+    All keys and retries share one deadline of GEMINI_DEADLINE_FACTOR * `timeout`:
+    each request is cut to the time left and no retry or key starts once it has passed.
     """
     safety_settings = {
         'HARM_CATEGORY_HARASSMENT': 'BLOCK_NONE', 'HARM_CATEGORY_HATE_SPEECH': 'BLOCK_NONE',
         'HARM_CATEGORY_SEXUALLY_EXPLICIT': 'BLOCK_NONE', 'HARM_CATEGORY_DANGEROUS_CONTENT': 'BLOCK_NONE'
     }
+    generation_config = {'temperature': temperature} if temperature is not None else None
+    deadline = time.monotonic() + timeout * GEMINI_DEADLINE_FACTOR
+
+    for i in range(len(API_KEYS)):
+        for attempt in range(1, GEMINI_MAX_ATTEMPTS + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error("❌ Gemini call ran out of time before any API key succeeded.")
+                return None
+            request_options = {'timeout': min(timeout, remaining)}
+            try:
+                logger.debug("Attempting Gemini call with key #%d (attempt %d)", i + 1, attempt)
+                model = _model_for_key(i, model_name)
+                
+                if is_chat:
+                    chat_session = model.start_chat(history=history or [])
+                    response = chat_session.send_message(prompt, request_options=request_options)
+                else:
+                    response = model.generate_content(prompt, safety_settings=safety_settings, generation_config=generation_config, request_options=request_options)
+
+                logger.debug("Gemini call successful with key #%d", i + 1)
+                return response
+
+            except (google_exceptions.DeadlineExceeded, google_exceptions.ServiceUnavailable, TimeoutError) as e:
+                if attempt == GEMINI_MAX_ATTEMPTS:
+                    logger.warning("⚠️ API Key #%d still failing after %d attempts. Trying next key. Error: %s", i + 1, attempt, type(e).__name__)
+                    break
+                delay = min(GEMINI_RETRY_MAX_DELAY, 2 ** (attempt - 1), max(0.0, deadline - time.monotonic()))
+                logger.warning("⚠️ API Key #%d timed out or unavailable. Retrying in %.1fs. Error: %s", i + 1, delay, type(e).__name__)
+                time.sleep(delay)
+            except (google_exceptions.ResourceExhausted, google_exceptions.PermissionDenied, google_exceptions.InternalServerError) as e:
+                logger.warning("⚠️ API Key #%d failed. Trying next key. Error: %s", i + 1, type(e).__name__)
+                break
+            except Exception as e:
+                logger.warning("⚠️ Unexpected error with API Key #%d. Trying next key. Error: %s", i + 1, type(e).__name__)
+                break
+    
+    logger.error("❌ All available Gemini API keys failed. The request could not be completed.")
+    return None
 
-    for i, key in enumerate(API_KEYS):
+def _stream_gemini_with_fallback(prompt: str, history: List = None, model_name: str = MODEL_NAME, timeout: float = GEMINI_TIMEOUT_SECONDS) -> Iterator[str]:
+    """
+    Streaming variant of _call_gemini_with_fallback for chat sessions: yields text chunks as Gemini produces them.
+    Falls back to the next API key only until the first chunk has been yielded; after that a failure
+    ends the stream (the client already has partial text). No retries or coalescing here.
+    Raises if every key fails before producing any text.
+    """
+    for i in range(len(API_KEYS)):
+        started = False
         try:
-            print(f"DEBUG(ai_core): Attempting API call with key #{i + 1}")
-            genai.configure(api_key=key)
-            model = genai.GenerativeModel(MODEL_NAME)
-            
-            if is_chat:
-                chat_session = model.start_chat(history=history or [])
-                response = chat_session.send_message(prompt)
-            else:
-                response = model.generate_content(prompt, safety_settings=safety_settings)
-
-            print(f"DEBUG(ai_core): API call successful with key #{i + 1}")
-            return response
-        
-        except (google_exceptions.ResourceExhausted, google_exceptions.PermissionDenied, google_exceptions.InternalServerError) as e:
-            print(f"⚠️ WARNING: API Key #{i + 1} failed. Trying next key. Error: {type(e).__name__}")
+            logger.debug("Attempting streaming Gemini call with key #%d", i + 1)
+            # Bound to this key's own client, so other calls can't switch the key while the stream is open.
+            model = _model_for_key(i, model_name)
+            chat_session = model.start_chat(history=history or [])
+            for chunk in chat_session.send_message(prompt, stream=True, request_options={'timeout': timeout}):
+                if chunk.text:
+                    started = True
+                    yield chunk.text
+            return
         except Exception as e:
-            print(f"⚠️ WARNING: An unexpected error occurred with API Key #{i + 1}. Trying next key. Error: {type(e).__name__}")
-    
-    print("❌ CRITICAL ERROR: All available Gemini API keys failed. The request could not be completed.")
-    return None
+            if started:
+                logger.warning("⚠️ Stream with API Key #%d broke off mid-response. Error: %s", i + 1, type(e).__name__)
+                return
+            logger.warning("⚠️ Streaming call with API Key #%d failed. Trying next key. Error: %s", i + 1, type(e).__name__)
+
+    logger.error("❌ All available Gemini API keys failed. The request could not be completed.")
+    raise Exception("AI response failed after trying all API keys.")
+
+def to_sse_events(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Formats text chunks as Server-Sent Events: one `data: {"text": ...}` event per chunk, then `data: [DONE]`.
+    A failure is reported as a final `data: {"error": ...}` event, since the 200 status is already sent.
+    """
+    try:
+        for chunk in chunks:
+            yield f"data: {json.dumps({'text': chunk})}\n\n"
+    except Exception as e:
+        logger.error("❌ Error while streaming AI response: %s", e)
+        yield f"data: {json.dumps({'error': 'AI failed to generate a response.'})}\n\n"
+    yield "data: [DONE]\n\n"
 
 # =========================
 # JSON Schema Constants (Your code - UNCHANGED)
@@ -153,6 +289,100 @@ FULL_RESUME_ANALYSIS_SCHEMA = """
 }
 """
 
+# =========================
+# Prompt Templates (pre-rendered once at import; only the variable parts are filled per call)
+# =========================
+def _escape_format_braces(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+_ASSESSMENT_PROMPT_TEMPLATE = """
+    You are an expert technical interviewer and AI assessment designer.
+    Your task is to generate a concise, focused skill assessment with exactly {num_questions} questions.
+    The assessment should cover the following skills: **{skills_str}**.
+    The target context is {assessment_label} role{role_context}, at a {difficulty_hint} level.
+
+    **Instructions for Question Generation:**
+    1.  Generate a mix of question types:
+        -   **Single-choice (radio buttons):** ~50% of questions. Provide 4 distinct options.
+        -   **Multiple-choice (checkboxes):** ~20% of questions. Provide 4 distinct options, clearly indicating ALL correct answers.
+        -   **Short-answer:** ~20% of questions. Requires a concise text response.
+        -   **Coding challenge:** ~10% of questions. Provide a clear problem statement and expected output/logic. (If this is too complex for 1.5-flash to reliably generate, favor more short-answer).
+    2.  Ensure questions cover both theoretical understanding and practical application of the skills.
+    3.  Assign a unique `question_id` (e.g., "q1", "q2") to each question.
+    4.  For each multiple/single choice question, you MUST provide the `correct_answer_keys` (a list of option values that are correct). This is CRITICAL for automated grading.
+    
+    **JSON Output Schema (List of Question Objects):**
+""" + _escape_format_braces(ASSESSMENT_QUESTIONS_SCHEMA.strip()) + """
+    **Critical Rules:**
+    - Your final output MUST be a JSON array containing exactly {num_questions} question objects.
+    - DO NOT include any introductory or concluding text outside the JSON.
+    - Ensure `correct_answer_keys` is always a LIST, even if only one answer.
+    """
+
+_ASSESSMENT_EVALUATION_PROMPT_TEMPLATE = """
+    You are an expert technical interviewer and AI grader.
+    Your task is to evaluate a user's submitted answers for a skill assessment.
+    Provide a comprehensive, structured evaluation based on the answers provided.
+
+    **Instructions for Evaluation:**
+    1.  **Calculate Overall Score:** Assign an overall percentage score (0-100%) for the assessment.
+    2.  **Identify Skills Mastered/Areas to Improve (Counts):** Based on the questions and answers, estimate how many distinct skills were demonstrated proficiently and how many need significant improvement.
+    3.  **List Strengths:** Provide 2-3 specific bullet points highlighting what the user did well.
+    4.  **List Weaknesses:** Provide 2-3 specific bullet points highlighting areas where the user struggled or demonstrated gaps.
+    5.  **Personalized Recommendations:** Provide 2-3 actionable, general recommendations for improvement. These should be text-based recommendations, not URLs.
+
+    **User's Submitted Answers:**
+    ------------------------------
+    {answers_text}
+    ------------------------------
+
+    **JSON Output Schema:**
+""" + _escape_format_braces(ASSESSMENT_EVALUATION_SCHEMA.strip()) + """
+    **Critical Rules:**
+    - Your final output MUST be a single, valid JSON object following the schema.
+    - DO NOT include any introductory or concluding text outside the JSON.
+    - The `skill_scores` should be an object mapping skill names (e.g., Python, SQL) to a proficiency score (0-100). Infer these skills from the context of the assessment.
+    """
+
+_FULL_RESUME_ANALYSIS_PROMPT_TEMPLATE = """
+    You are an expert HR consultant and AI resume analyst. Your task is to provide a comprehensive analysis of the given resume.
+    Generate a detailed report covering overall assessment, specific section analyses, key strengths, areas for improvement,
+    and a dedicated ATS optimization score, all in a single JSON object.
+
+    **Instructions:**
+    1.  **Analysis Date:** Current date (e.g., "September 05, 2025").
+    2.  **Job Role Context:** Infer a primary job role from the provided job description (if any) or from the resume itself. Default to "General Candidate" if unclear.
+    3.  **AI Model:** "Google Gemini"
+    4.  **Overall Resume Score:** A percentage (0-100) reflecting general quality, clarity, and effectiveness.
+    5.  **Overall Resume Grade:** A concise word (e.g., "Excellent", "Good", "Fair", "Needs Improvement") corresponding to the score.
+    6.  **ATS Optimization Score:** A percentage (0-100) reflecting compatibility with Applicant Tracking Systems, especially considering the job description.
+    7.  **Section-wise Analysis:** Provide a 'title' and 'summary' for:
+        -   `professional_profile_analysis`: For the summary/objective section.
+        -   `education_analysis`: For the education section.
+        -   `experience_analysis`: For work experience and projects.
+        -   `skills_analysis`: For the skills section.
+    8.  **Key Strengths:** 2-3 bullet points highlighting positive aspects.
+    9.  **Areas for Improvement:** 3-5 bullet points covering general resume improvements AND specific ATS issues (e.g., keyword gaps, formatting problems).
+    10. **Overall Assessment:** A concluding paragraph summarizing the findings and potential for improvement.
+
+    {job_desc_context}
+
+    **Resume Text:**
+    ```
+    {resume_text}
+    ```
+
+    **JSON Output Schema:**
+""" + _escape_format_braces(FULL_RESUME_ANALYSIS_SCHEMA.strip()) + """
+    **Critical Rules:**
+    - Your final output MUST be a single, valid JSON object following the schema.
+    - DO NOT include any introductory or concluding text outside the JSON.
+    - Ensure all scores are integers (0-100).
+    - If no job description is provided, make reasonable general assumptions for the 'Job Role Context' and ATS analysis.
+    - For `analysis_date`, always use the current date in 'Month DD, YYYY' format.
+    - For section summaries, be direct and actionable, similar to the provided examples.
+    """
+
 # =========================
 # Helper Functions (Your code - UNCHANGED)
 # =========================
@@ -205,7 +435,7 @@ def _stringify_list_content(content: Any) -> str:
     return "\n".join(string_parts)
 
 def extract_text_auto(file_content: bytes, file_extension: str) -> Optional[str]:
-    print(f"DEBUG(ai_core): extract_text_auto called for in-memory content (Type: {file_extension})")
+    logger.debug("extract_text_auto called for in-memory content (Type: %s)", file_extension)
     try:
         if file_extension == ".pdf":
             with fitz.open(stream=file_content, filetype="pdf") as doc: 
@@ -222,7 +452,7 @@ def extract_text_auto(file_content: bytes, file_extension: str) -> Optional[str]
         else:
             return None
     except Exception as e:
-        print(f"ERROR(ai_core): Failed to read file content. Exception: {e}", exc_info=True)
+        logger.error("Failed to read file content. Exception: %s", e, exc_info=True)
         return None
 
 # ============================================
@@ -334,7 +564,7 @@ CONTEXT: You are an elite career strategist and executive resume writer. Your ta
 {base_prompt_context}
 TASK: Apply your full transformation checklist to optimize ONLY the following JSON section, named "{mapped}".
 --- INPUT JSON SECTION ---
-{json.dumps(sec_data, indent=2)}
+{json.dumps(sec_data, indent=2, default=str)}
 --- END INPUT JSON ---
 """
     else:
@@ -342,7 +572,7 @@ TASK: Apply your full transformation checklist to optimize ONLY the following JS
 {base_prompt_context}
 TASK: Apply your full transformation checklist to optimize all sections of the following resume JSON.
 --- FULL INPUT JSON ---
-{json.dumps(resume_json, indent=2)}
+{json.dumps(resume_json, indent=2, default=str)}
 --- END INPUT JSON ---
 """
     response = _call_gemini_with_fallback(prompt)
@@ -491,7 +721,31 @@ def generate_career_roadmap(user_profile: Dict[str, Any]) -> Optional[Dict[str,
     except Exception as e:
         print(f"An error occurred during AI roadmap generation: {e}"); return None
 
+# In-process LRU of tutor explanations keyed by normalized topic. Popular topics repeat across
+# users and the explanation doesn't depend on who asks, so a hit skips the Gemini call entirely.
+# Only successful explanations are cached. Cached dicts are shared: treat them as read-only.
+TUTOR_CACHE_MAX_ENTRIES = 2048
+_tutor_cache: LRUCache = LRUCache(maxsize=TUTOR_CACHE_MAX_ENTRIES)
+_tutor_cache_lock = threading.Lock()
+
+def tutor_topic_key(topic: str) -> str:
+    return topic.lower().strip()
+
+def get_cached_tutor_explanation(topic: str) -> Optional[Dict[str, Any]]:
+    key = tutor_topic_key(topic)
+    with _tutor_cache_lock: # cachetools caches aren't thread-safe, and a read updates the LRU order
+        return _tutor_cache.get(key)
+
+def remember_tutor_explanation(topic: str, explanation: Dict[str, Any]):
+    key = tutor_topic_key(topic)
+    with _tutor_cache_lock:
+        _tutor_cache[key] = explanation
+
 def get_tutor_explanation(topic: str) -> Optional[Dict[str, Any]]:
+    cached = get_cached_tutor_explanation(topic)
+    if cached is not None:
+        return cached
+    topic = topic.strip()
     prompt = f"""
     Act as a friendly and encouraging expert tutor. A user is currently working through a personalized learning plan and is stuck on the following topic: **"{topic}"**
 
@@ -504,46 +758,154 @@ def get_tutor_explanation(topic: str) -> Optional[Dict[str, Any]]:
     Generate the JSON object and nothing else.
     """
 
-    response = _call_gemini_with_fallback(prompt)
+    # temperature=0 keeps the answer for a topic stable, which is what makes caching it sound.
+    response = _call_gemini_with_fallback(prompt, temperature=0)
     if not response: return None
     cleaned_response_text = response.text.replace('```json', '').replace('```', '').strip()
     try:
-        return json.loads(cleaned_response_text)
+        explanation = json.loads(cleaned_response_text)
     except Exception as e:
         print(f"An error occurred in AI Tutor: {e}"); return None
+    remember_tutor_explanation(topic, explanation)
+    return explanation
 
-def get_chatbot_response(query: str, history: list, career_plan_summary: str) -> dict:
+# =========================
+# Chatbot Scope Pre-filter
+# =========================
+EMBEDDING_MODEL_NAME = "models/text-embedding-004"
+OUT_OF_SCOPE_SIMILARITY_THRESHOLD = 0.5
+# The pre-filter sits in front of the chatbot reply, so all of its embedding work (every key tried)
+# shares one short deadline; when that runs out the query is simply let through.
+SCOPE_PREFILTER_DEADLINE_SECONDS = 2
+OUT_OF_SCOPE_REPLY = "That question seems to be outside the scope of your current career plan. Is there anything I can help you with related to your career plan?"
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#.]*")
+_STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "could", "do", "does", "for", "from",
+    "i", "if", "in", "is", "it", "me", "my", "of", "on", "or", "should", "so", "that", "the", "this",
+    "to", "was", "what", "when", "where", "which", "who", "why", "how", "will", "with", "would", "you", "your",
+})
+# Words that are always in scope for the chatbot, whatever the plan contains
+# (generic career vocabulary, greetings and conversational follow-ups).
+_IN_SCOPE_TERMS = frozenset({
+    "career", "plan", "roadmap", "skill", "skills", "learn", "learning", "study", "project", "projects",
+    "course", "courses", "phase", "phases", "topic", "topics", "job", "jobs", "role", "score", "match",
+    "timeline", "week", "weeks", "month", "months", "hours", "goal", "priority", "next", "start", "first",
+    "interview", "resume", "certificate", "certification", "hi", "hello", "hey", "thanks", "thank",
+    "explain", "elaborate", "more", "example", "help",
+})
+
+def _tokenize(text: str) -> set:
+    tokens = {t.rstrip(".") for t in _TOKEN_RE.findall((text or "").lower())}
+    return {t for t in tokens if len(t) > 1 and t not in _STOPWORDS}
+
+@lru_cache(maxsize=256)
+def _extract_plan_terms(career_plan_summary: str) -> frozenset:
+    """Meaningful tokens of a plan summary. Cached per plan, so it is computed once per user's plan."""
+    return frozenset(_tokenize(career_plan_summary)) | _IN_SCOPE_TERMS
+
+def _embed_with_fallback(texts: List[str], deadline: float) -> List[List[float]]:
+    """
+    Embeds several texts in one request with the first working API key, each key bound by its own
+    client (as in _call_gemini_uncoalesced). Keys are only tried while time.monotonic() is before
+    `deadline`, and each request is cut to the time left. Raises if no key answers in time.
+    """
+    for i in range(len(API_KEYS)):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            result = genai.embed_content(model=EMBEDDING_MODEL_NAME, content=texts, task_type="semantic_similarity", client=_client_for_key(i), request_options={'timeout': remaining})
+            return result['embedding']
+        except Exception as e:
+            logger.warning("⚠️ Embedding call failed with API Key #%d. Trying next key. Error: %s", i + 1, type(e).__name__)
+    raise RuntimeError("No Gemini API key returned the embedding before the pre-filter deadline.")
+
+# Plan embeddings, cached per plan summary. Failures raise and are therefore never cached.
+_plan_embeddings: LRUCache = LRUCache(maxsize=256)
+_plan_embeddings_lock = threading.Lock()
+
+def _embed_query_and_plan(query: str, career_plan_summary: str, deadline: float) -> Tuple[List[float], Tuple[float, ...]]:
+    """One embedding request per pre-filter: just the query on a plan-cache hit, query and plan together on a miss."""
+    with _plan_embeddings_lock:
+        plan_embedding = _plan_embeddings.get(career_plan_summary)
+    if plan_embedding is not None:
+        return _embed_with_fallback([query], deadline)[0], plan_embedding
+    query_embedding, plan_values = _embed_with_fallback([query, career_plan_summary], deadline)
+    plan_embedding = tuple(plan_values)
+    with _plan_embeddings_lock:
+        _plan_embeddings[career_plan_summary] = plan_embedding
+    return query_embedding, plan_embedding
+
+def _cosine_similarity(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+def _is_clearly_out_of_scope(query: str, career_plan_summary: str, model_history: list) -> bool:
+    """
+    Cheap local gatekeeper run before the chatbot's Gemini call. A query is only
+    rejected when it shares no meaningful token with the plan AND its embedding
+    is far from the plan's. Any doubt (or an embedding failure) lets it through, and the
+    embedding work is capped at SCOPE_PREFILTER_DEADLINE_SECONDS in total.
+    Only opening questions are checked: a follow-up ("what about the second one?")
+    depends on the conversation, which the query alone doesn't show.
+    """
+    if model_history:
+        return False
+    query_terms = _tokenize(query)
+    if not query_terms or query_terms & _extract_plan_terms(career_plan_summary):
+        return False
+    try:
+        deadline = time.monotonic() + SCOPE_PREFILTER_DEADLINE_SECONDS
+        similarity = _cosine_similarity(*_embed_query_and_plan(query, career_plan_summary, deadline))
+    except Exception as e:
+        logger.warning("⚠️ Scope pre-filter skipped, embedding failed: %s", e)
+        return False
+    return similarity < OUT_OF_SCOPE_SIMILARITY_THRESHOLD
+
+def get_chatbot_response(query: str, model_history: list, career_plan_summary: str) -> dict:
     """
     Generates a chatbot response using the pre-summarized career plan string as context.
     
     Args:
         query: The user's latest question.
-        history: The previous conversation history.
+        model_history: The previous conversation, ALREADY in Gemini format
+            ({'role': 'user'|'model', 'parts': [content]}, no empty messages).
         career_plan_summary: A PRE-SUMMARIZED STRING of the user's career plan.
     """
-    print("AI Core: Received request. The career plan context is a string.")
-    
+    logger.debug("Chatbot request received; the career plan context is a string.")
+
+    if _is_clearly_out_of_scope(query, career_plan_summary, model_history):
+        logger.debug("Chatbot query rejected locally as out of scope. Skipping Gemini call.")
+        return {"response": OUT_OF_SCOPE_REPLY}
+
+    full_prompt = _build_chatbot_prompt(query, career_plan_summary)
+    response = _call_gemini_with_fallback(prompt=full_prompt, is_chat=True, history=model_history, timeout=15)
+
+    if not response or not response.text:
+        raise Exception("AI response failed after trying all API keys.")
+    return {"response": response.text}
+
+def stream_chatbot_response(query: str, model_history: list, career_plan_summary: str) -> Iterator[str]:
+    """Same as get_chatbot_response, but yields the reply text in chunks as Gemini generates it."""
+    if _is_clearly_out_of_scope(query, career_plan_summary, model_history):
+        logger.debug("Chatbot query rejected locally as out of scope. Skipping Gemini call.")
+        yield OUT_OF_SCOPE_REPLY
+        return
+    yield from _stream_gemini_with_fallback(_build_chatbot_prompt(query, career_plan_summary), history=model_history, timeout=15)
+
+def _build_chatbot_prompt(query: str, career_plan_summary: str) -> str:
     system_prompt = (
         f"You are an AI career strategist and tutor. Your purpose is to provide concise, point-to-point, and beginner-friendly guidance to the user, strictly based on the career plan provided below.\n\n"
         f"**Career Plan Details:**\n{career_plan_summary}\n\n"
         f"**Your Instructions:**\n"
         f"1. Keep responses brief, beginner-friendly, and to the point.\n"
         f"2. You can answer questions related to the provided career plan, including the **job match score, priority skills, timeline, detailed roadmap, projects, and courses**.\n"
-        f"3. If the user asks a question that is **outside the scope** of the career plan's domain or is not directly related to the provided plan data, you must respond with a polite refusal. For example, 'That question seems to be outside the scope of your current career plan. Is there anything I can help you with related to your career plan?'\n\n"
+        f"3. If the user asks a question that is **outside the scope** of the career plan's domain or is not directly related to the provided plan data, you must respond with a polite refusal. For example, '{OUT_OF_SCOPE_REPLY}'\n\n"
         f"Let's begin."
     )
-    model_history = []
-    for message in history:
-        role = 'user' if message.get('role') == 'user' else 'model'
-        content = message.get('content', '')
-        if content: model_history.append({'role': role, 'parts': [content]})
-
-    full_prompt = f"{system_prompt}\n\nUSER QUESTION: {query}"
-    response = _call_gemini_with_fallback(prompt=full_prompt, is_chat=True, history=model_history)
-
-    if not response or not response.text:
-        raise Exception("AI response failed after trying all API keys.")
-    return {"response": response.text}
+    return f"{system_prompt}\n\nUSER QUESTION: {query}"
 
 def generate_assessment_questions(assessment_type: str, skills: List[str], target_role: Optional[str] = None, num_questions: int = 5, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """
@@ -562,29 +924,13 @@ def generate_assessment_questions(assessment_type: str, skills: List[str], targe
         difficulty_hint = "medium to advanced difficulty"
 
 
-    prompt = f"""
-    You are an expert technical interviewer and AI assessment designer.
-    Your task is to generate a concise, focused skill assessment with exactly {num_questions} questions.
-    The assessment should cover the following skills: **{skills_str}**.
-    The target context is {assessment_type.replace('_', ' ').title()} role{role_context}, at a {difficulty_hint} level.
-
-    **Instructions for Question Generation:**
-    1.  Generate a mix of question types:
-        -   **Single-choice (radio buttons):** ~50% of questions. Provide 4 distinct options.
-        -   **Multiple-choice (checkboxes):** ~20% of questions. Provide 4 distinct options, clearly indicating ALL correct answers.
-        -   **Short-answer:** ~20% of questions. Requires a concise text response.
-        -   **Coding challenge:** ~10% of questions. Provide a clear problem statement and expected output/logic. (If this is too complex for 1.5-flash to reliably generate, favor more short-answer).
-    2.  Ensure questions cover both theoretical understanding and practical application of the skills.
-    3.  Assign a unique `question_id` (e.g., "q1", "q2") to each question.
-    4.  For each multiple/single choice question, you MUST provide the `correct_answer_keys` (a list of option values that are correct). This is CRITICAL for automated grading.
-    
-    **JSON Output Schema (List of Question Objects):**
-{ASSESSMENT_QUESTIONS_SCHEMA.strip()}
-    **Critical Rules:**
-    - Your final output MUST be a JSON array containing exactly {num_questions} question objects.
-    - DO NOT include any introductory or concluding text outside the JSON.
-    - Ensure `correct_answer_keys` is always a LIST, even if only one answer.
-    """
+    prompt = _ASSESSMENT_PROMPT_TEMPLATE.format_map({
+        'num_questions': num_questions,
+        'skills_str': skills_str,
+        'assessment_label': assessment_type.replace('_', ' ').title(),
+        'role_context': role_context,
+        'difficulty_hint': difficulty_hint,
+    })
 
     response = _call_gemini_with_fallback(prompt)
     if not response: return None
@@ -615,30 +961,7 @@ def evaluate_assessment_answers(user_id: str, submitted_answers: List[Dict[str,
 
     answers_text = "\n".join(answers_summary)
 
-    prompt = f"""
-    You are an expert technical interviewer and AI grader.
-    Your task is to evaluate a user's submitted answers for a skill assessment.
-    Provide a comprehensive, structured evaluation based on the answers provided.
-
-    **Instructions for Evaluation:**
-    1.  **Calculate Overall Score:** Assign an overall percentage score (0-100%) for the assessment.
-    2.  **Identify Skills Mastered/Areas to Improve (Counts):** Based on the questions and answers, estimate how many distinct skills were demonstrated proficiently and how many need significant improvement.
-    3.  **List Strengths:** Provide 2-3 specific bullet points highlighting what the user did well.
-    4.  **List Weaknesses:** Provide 2-3 specific bullet points highlighting areas where the user struggled or demonstrated gaps.
-    5.  **Personalized Recommendations:** Provide 2-3 actionable, general recommendations for improvement. These should be text-based recommendations, not URLs.
-
-    **User's Submitted Answers:**
-    {'-'*30}
-    {answers_text}
-    {'-'*30}
-
-    **JSON Output Schema:**
-{ASSESSMENT_EVALUATION_SCHEMA.strip()}
-    **Critical Rules:**
-    - Your final output MUST be a single, valid JSON object following the schema.
-    - DO NOT include any introductory or concluding text outside the JSON.
-    - The `skill_scores` should be an object mapping skill names (e.g., Python, SQL) to a proficiency score (0-100). Infer these skills from the context of the assessment.
-    """
+    prompt = _ASSESSMENT_EVALUATION_PROMPT_TEMPLATE.format_map({'answers_text': answers_text})
     response = _call_gemini_with_fallback(prompt)
     if not response: return None
     results = _safe_json_loads(response.text, fallback=None)
@@ -668,10 +991,10 @@ def generate_full_resume_analysis(resume_text: str, job_description: Optional[st
     {job_description}
     ```
     """
-        # A simple AI call to infer job role, now using the fallback mechanism.
+        # A simple AI call to infer job role, now using the fallback mechanism and the lighter model.
         role_prompt = f"Extract the primary job role from the following job description. Respond with only the job role text (e.g., 'Software Engineer', 'Data Scientist', 'Frontend Developer').\n\nJob Description: {job_description}"
         
-        role_response = _call_gemini_with_fallback(role_prompt) # Using the new fallback function here.
+        role_response = _call_gemini_with_fallback(role_prompt, model_name=SMALL_MODEL_NAME)
         
         if role_response and role_response.text:
             inferred_role = role_response.text.strip()
@@ -683,44 +1006,10 @@ def generate_full_resume_analysis(resume_text: str, job_description: Optional[st
 
 
     # This is your original main prompt, it remains unchanged.
-    prompt = f"""
-    You are an expert HR consultant and AI resume analyst. Your task is to provide a comprehensive analysis of the given resume.
-    Generate a detailed report covering overall assessment, specific section analyses, key strengths, areas for improvement,
-    and a dedicated ATS optimization score, all in a single JSON object.
-
-    **Instructions:**
-    1.  **Analysis Date:** Current date (e.g., "September 05, 2025").
-    2.  **Job Role Context:** Infer a primary job role from the provided job description (if any) or from the resume itself. Default to "General Candidate" if unclear.
-    3.  **AI Model:** "Google Gemini"
-    4.  **Overall Resume Score:** A percentage (0-100) reflecting general quality, clarity, and effectiveness.
-    5.  **Overall Resume Grade:** A concise word (e.g., "Excellent", "Good", "Fair", "Needs Improvement") corresponding to the score.
-    6.  **ATS Optimization Score:** A percentage (0-100) reflecting compatibility with Applicant Tracking Systems, especially considering the job description.
-    7.  **Section-wise Analysis:** Provide a 'title' and 'summary' for:
-        -   `professional_profile_analysis`: For the summary/objective section.
-        -   `education_analysis`: For the education section.
-        -   `experience_analysis`: For work experience and projects.
-        -   `skills_analysis`: For the skills section.
-    8.  **Key Strengths:** 2-3 bullet points highlighting positive aspects.
-    9.  **Areas for Improvement:** 3-5 bullet points covering general resume improvements AND specific ATS issues (e.g., keyword gaps, formatting problems).
-    10. **Overall Assessment:** A concluding paragraph summarizing the findings and potential for improvement.
-
-    {job_desc_context}
-
-    **Resume Text:**
-    ```
-    {resume_text}
-    ```
-
-    **JSON Output Schema:**
-{FULL_RESUME_ANALYSIS_SCHEMA.strip()}
-    **Critical Rules:**
-    - Your final output MUST be a single, valid JSON object following the schema.
-    - DO NOT include any introductory or concluding text outside the JSON.
-    - Ensure all scores are integers (0-100).
-    - If no job description is provided, make reasonable general assumptions for the 'Job Role Context' and ATS analysis.
-    - For `analysis_date`, always use the current date in 'Month DD, YYYY' format.
-    - For section summaries, be direct and actionable, similar to the provided examples.
-    """
+    prompt = _FULL_RESUME_ANALYSIS_PROMPT_TEMPLATE.format_map({
+        'job_desc_context': job_desc_context,
+        'resume_text': resume_text,
+    })
     
     # --- MODIFIED SECTION ---
     # The main API call for the analysis also uses the fallback function now.
@@ -752,6 +1041,29 @@ def get_interview_chat_response(job_description: str, history: List[Dict[str, st
     """
     Acts as an AI Interviewer with adjustable difficulty, now with API key fallback.
     """
+    last_user_message, chat_history_for_api = _build_interview_chat_request(job_description, history, difficulty)
+
+    # Call our resilient fallback function with the chat parameters.
+    response = _call_gemini_with_fallback(
+        prompt=last_user_message, 
+        is_chat=True, 
+        history=chat_history_for_api
+    )
+
+    # Check the result and return the appropriate response.
+    if not response or not response.text:
+        print(f"An error occurred in the interview chat endpoint after all fallbacks.")
+        return None # Return None on total failure
+
+    return {"reply": response.text}
+
+def stream_interview_chat_response(job_description: str, history: List[Dict[str, str]], difficulty: str) -> Iterator[str]:
+    """Same as get_interview_chat_response, but yields the interviewer's reply in chunks as Gemini generates it."""
+    last_user_message, chat_history_for_api = _build_interview_chat_request(job_description, history, difficulty)
+    yield from _stream_gemini_with_fallback(last_user_message, history=chat_history_for_api)
+
+def _build_interview_chat_request(job_description: str, history: List[Dict[str, str]], difficulty: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Builds (newest user message, prior Gemini chat history) for the interviewer persona."""
     # This is your original logic to determine the AI's personality based on difficulty.
     # It remains completely unchanged.
     if difficulty == 'easy':
@@ -802,29 +1114,20 @@ def get_interview_chat_response(job_description: str, history: List[Dict[str, st
     
     # The 'history' is everything that came before the user's newest message.
     chat_history_for_api = full_history[:-1]
-    
-    # Call our resilient fallback function with the chat parameters.
-    response = _call_gemini_with_fallback(
-        prompt=last_user_message, 
-        is_chat=True, 
-        history=chat_history_for_api
-    )
-
-    # Check the result and return the appropriate response.
-    if not response or not response.text:
-        print(f"An error occurred in the interview chat endpoint after all fallbacks.")
-        return None # Return None on total failure
-
-    return {"reply": response.text}
+    return last_user_message, chat_history_for_api
     # --- END MODIFIED SECTION ---
 
-def get_interview_summary(job_description: str, history: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+def get_interview_summary(job_description: str, history: List[Dict[str, str]], transcript: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """
     Analyzes the full interview transcript and provides a performance summary,
     now with API key fallback.
+
+    If the caller already maintains the transcript incrementally (one
+    "role: content" line appended per turn), pass it as `transcript` and the
+    history is not re-joined.
     """
-    # This is your original logic for creating the transcript. It remains unchanged.
-    transcript = "\n".join([f"{msg['role']}: {msg['content']}" for msg in history])
+    if transcript is None:
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in history)
 
     # This is your original, detailed prompt for the AI. It also remains unchanged.
     prompt = f"""
@@ -851,8 +1154,8 @@ def get_interview_summary(job_description: str, history: List[Dict[str, str]]) -
     - Your final output must be ONLY the valid JSON object. Do not include markdown or any other text.
     - Be honest and constructive in your feedback.
     """
-    # 1. Call the API using our new fallback function.
-    response = _call_gemini_with_fallback(prompt)
+    # 1. Call the API using our new fallback function. Summaries of long interviews get a longer timeout.
+    response = _call_gemini_with_fallback(prompt, timeout=45)
 
     # 2. Handle the case where all API keys failed.
     if not response or not response.text:
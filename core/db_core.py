@@ -2,37 +2,133 @@ import os
 import sys
 import json
 import re
+import copy
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Tuple, Dict, Any, List
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from cachetools import TTLCache
 
 from fastapi.params import Query
+from fastapi.concurrency import run_in_threadpool
 import firebase_admin
 from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+def _format_dict_item(kv) -> str:
+    """Renders one (key, value) pair of a dict list item, e.g. ('start_date', x) -> 'Start Date: x'."""
+    return f"{kv[0].replace('_', ' ').title()}: {kv[1]}"
+
+def _stringify_list_item(item: Any) -> str:
+    if isinstance(item, str): return item
+    if isinstance(item, dict): return ", ".join(map(_format_dict_item, item.items()))
+    return str(item)
 
 def _stringify_list_content(content: Any) -> str:
     """Safely converts a list of strings or dicts into a single newline-separated string."""
+    if isinstance(content, str): return content # Fast path: most parsed descriptions are already strings
     if not isinstance(content, list): return str(content or "")
-    string_parts = []
-    for item in content:
-        if isinstance(item, str): string_parts.append(item)
-        elif isinstance(item, dict):
-            string_parts.append(", ".join([f"{k.replace('_', ' ').title()}: {v}" for k, v in item.items()]))
-        else: string_parts.append(str(item))
-    return "\n".join(string_parts)
-
-def _convert_firestore_timestamps(obj: Any) -> Any:
+    return "\n".join(map(_stringify_list_item, content))
+
+def _topic_name(topic: Any) -> Optional[str]:
+    return topic if isinstance(topic, str) else topic.get('name') if isinstance(topic, dict) else None
+
+def _build_task_index(detailed_roadmap: Any) -> List[Dict[str, Any]]:
+    """
+    Small per-phase index of topic names ([{'phase_title', 'topics': [name, ...]}], in phase order)
+    stored next to the roadmap, so a task toggle can validate its target without reading the full roadmap.
+    """
+    if not isinstance(detailed_roadmap, list):
+        return []
+    return [
+        {
+            'phase_title': phase.get('phase_title') if isinstance(phase, dict) else None,
+            'topics': [name for name in map(_topic_name, phase.get('topics') or []) if name is not None] if isinstance(phase, dict) else [],
+        }
+        for phase in detailed_roadmap
+    ]
+
+def _find_task_phase(task_index: List[Dict[str, Any]], phase_title: str, topic_name: str, phase_index: Optional[int] = None) -> Optional[int]:
+    """
+    Position of the phase holding the task, or None if the roadmap has no such task.
+    An explicit phase_index wins; otherwise the first phase with this title that lists the topic.
+    """
+    if phase_index is not None:
+        if 0 <= phase_index < len(task_index) and topic_name in task_index[phase_index].get('topics', []):
+            return phase_index
+        return None
+    for i, phase in enumerate(task_index):
+        if phase.get('phase_title') == phase_title and topic_name in phase.get('topics', []):
+            return i
+    return None
+
+def _apply_task_status(roadmap: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Overlays the roadmap doc's 'task_status' map ({str(phase_index): {topic_name: bool}}) onto
+    'detailed_roadmap' topics, in place, and drops the map and the task index from the returned dict.
+    Keyed by phase position, so phases that share a title keep separate statuses.
     """
-    Recursively converts Firestore DatetimeWithNanoseconds objects (and standard datetime objects)
-    to ISO 8601 strings to make them JSON serializable.
+    roadmap.pop('task_index', None)
+    task_status = roadmap.pop('task_status', None)
+    if not task_status or not isinstance(roadmap.get('detailed_roadmap'), list):
+        return roadmap
+    for phase_index, phase in enumerate(roadmap['detailed_roadmap']):
+        statuses = task_status.get(str(phase_index)) if isinstance(phase, dict) else None
+        if not statuses or not isinstance(phase.get('topics'), list):
+            continue
+        for i, topic in enumerate(phase['topics']):
+            if isinstance(topic, str) and topic in statuses:
+                phase['topics'][i] = {"name": topic, "is_completed": statuses[topic]}
+            elif isinstance(topic, dict) and topic.get('name') in statuses:
+                topic['is_completed'] = statuses[topic['name']]
+    return roadmap
+
+# Firestore caps a WriteBatch at 500 operations.
+FIRESTORE_BATCH_LIMIT = 500
+
+# Section-key normalization table: ' ' and '-' -> '_' in one C-level pass.
+_NORMALIZE_KEY = str.maketrans({' ': '_', '-': '_'})
+
+class _ChunkedWriteBatch:
     """
-    if isinstance(obj, dict):
-        return {k: _convert_firestore_timestamps(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [_convert_firestore_timestamps(elem) for elem in obj]
-    elif isinstance(obj, datetime): # Corrected: Changed from datetime.datetime to just datetime
-        return obj.isoformat()
-    # If it's not a dict, list, or datetime object, return it as is
-    return obj
+    Collects writes into as many WriteBatches of at most 500 operations as needed,
+    so N writes cost ceil(N / 500) commit RPCs instead of N individual round trips.
+    """
+    def __init__(self, db):
+        self._db = db
+        self._batches = []
+        self._count = 0
+
+    def _batch_for_next_op(self):
+        if not self._batches or self._count == FIRESTORE_BATCH_LIMIT:
+            self._batches.append(self._db.batch())
+            self._count = 0
+        self._count += 1
+        return self._batches[-1]
+
+    def set(self, ref, data: Dict[str, Any], merge: bool = False):
+        self._batch_for_next_op().set(ref, data, merge=merge)
+
+    def update(self, ref, data: Dict[str, Any]):
+        self._batch_for_next_op().update(ref, data)
+
+    def delete(self, ref):
+        self._batch_for_next_op().delete(ref)
+
+    def commit(self, executor=None):
+        """
+        Commits every chunk. With an executor the chunks are committed concurrently;
+        only use that when no write in one chunk depends on a write in another.
+        """
+        batches, self._batches, self._count = self._batches, [], 0
+        if executor is None or len(batches) < 2:
+            for batch in batches:
+                batch.commit()
+            return
+        for future in [executor.submit(batch.commit) for batch in batches]:
+            future.result() # Re-raises the first failed commit
 
 
 class DatabaseManager:
@@ -61,6 +157,29 @@ class DatabaseManager:
         'certifications': ['certifications', 'licenses_&_certifications'],
         'skills': ['skills'],
     }
+    # Field masks for sub-collections whose document shape is fully controlled by this class.
+    # Resume sections (work_experiences, projects, ...) store whatever keys the AI parser
+    # produced, so they are read in full to avoid silently dropping fields.
+    _collection_fields = {
+        'skills': ['category', 'skill_name'],
+        'additional_sections': ['section_name', 'description', 'optimized_description'],
+    }
+
+    # Reverse lookup {variation: standard_key}, built once so mapping a key is a single dict get.
+    _variation_to_standard = {
+        variation: standard_key
+        for standard_key, variations in _ai_key_to_standard_map.items()
+        for variation in variations
+    }
+
+    # Shape of the per-user 'stats' map. Counters are written lazily by increment_user_stat,
+    # so readers overlay the stored map on these defaults.
+    default_user_stats = {
+        'roadmaps_generated': 0,
+        'resumes_optimized': 0,
+        'assessments_taken': 0,
+        'jobs_matched': 0,
+    }
 
     def __init__(self):
         """
@@ -72,25 +191,90 @@ class DatabaseManager:
         except Exception as e:
             print(f"❌ ERROR: DatabaseManager failed to get Firestore client. Is Firebase Admin SDK initialized? {e}")
             raise 
+        # Shared pool for concurrent Firestore round trips (the client is thread-safe).
+        self._executor = ThreadPoolExecutor(max_workers=8)
+        # Short-lived cache of fetch_resume_relational results keyed by (user_uid, get_optimized),
+        # stored with the user document's update_time it was built from. Every resume write touches
+        # the user document, so entries from before a write (in any worker) no longer match.
+        # This treats update_time as the version of the WHOLE resume, so it relies on every resume
+        # write committing its user-doc update last, after all sub-collection writes (see
+        # update_resume_relational / update_optimized_resume_relational). A write that bumps the
+        # user doc first would let a concurrent reader cache a half-written resume as current.
+        self._resume_cache = TTLCache(maxsize=1024, ttl=60)
+        self._resume_cache_lock = threading.Lock()
 
     def _map_ai_section_to_standard_key(self, ai_key: str) -> Optional[str]:
-        normalized_key = ai_key.lower().replace(" ", "_").replace("-", "_")
-        for standard_key, variations in self._ai_key_to_standard_map.items():
-            if normalized_key in variations: return standard_key
-        return None
+        return self._variation_to_standard.get(ai_key.lower().translate(_NORMALIZE_KEY))
     
+    def _stream_collections_parallel(self, user_doc_ref, collections: Dict[str, str]) -> Dict[str, list]:
+        """Streams several sub-collections concurrently. Returns {standard_key: [DocumentSnapshot, ...]}."""
+        def load(key: str) -> list:
+            query = user_doc_ref.collection(collections[key])
+            fields = self._collection_fields.get(key)
+            if fields:
+                query = query.select(fields)
+            return list(query.stream())
+
+        keys = list(collections.keys())
+        return dict(zip(keys, self._executor.map(load, keys)))
+
+    def _collections_to_fetch(self, user_data: Dict[str, Any], get_optimized: bool) -> Dict[str, str]:
+        """
+        Picks the sub-collections fetch_resume_relational still has to stream for this user.
+        - Legacy 'skills' docs are only needed when the user has no categorized_skills.
+        - A section already stored as a non-empty list in structured_resume_data is skipped,
+          unless the optimized view is requested (optimized descriptions only live in sub-collections).
+        """
+        structured_resume_data = user_data.get('structured_resume_data') or {}
+        collections = {}
+        for standard_key, collection_name in self._standard_to_db_collections_map.items():
+            if standard_key == 'skills':
+                if structured_resume_data and user_data.get('categorized_skills'):
+                    continue
+            elif standard_key != 'additional_sections' and not get_optimized:
+                section = structured_resume_data.get(standard_key)
+                if isinstance(section, list) and section:
+                    continue
+            collections[standard_key] = collection_name
+        return collections
+
+    def _invalidate_resume_cache(self, user_uid: str):
+        with self._resume_cache_lock:
+            self._resume_cache.pop((user_uid, True), None)
+            self._resume_cache.pop((user_uid, False), None)
+
     def fetch_resume_relational(self, user_uid: str, get_optimized: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Returns the user's resume assembled from the user document and its sub-collections.
+        The user document is always read; a cached result is only reused while the document's
+        update_time is unchanged, so a write made through another worker is never hidden.
+        A hit skips streaming the sub-collections. Callers always get their own deep copy.
+        """
         user_doc_ref = self.db.collection('users').document(user_uid)
+        # The user document is read first so we only stream the sub-collections it doesn't already cover.
         user_doc = user_doc_ref.get()
 
         if not user_doc.exists:
             print(f"User document with UID {user_uid} not found.")
             return None
 
+        cache_key = (user_uid, get_optimized)
+        with self._resume_cache_lock:
+            cached = self._resume_cache.get(cache_key)
+        if cached is not None and cached[0] == user_doc.update_time:
+            return copy.deepcopy(cached[1])
+
+        resume_data = self._build_resume_relational(user_doc_ref, user_doc, get_optimized)
+        with self._resume_cache_lock:
+            self._resume_cache[cache_key] = (user_doc.update_time, copy.deepcopy(resume_data))
+        return resume_data
+
+    def _build_resume_relational(self, user_doc_ref, user_doc, get_optimized: bool) -> Dict[str, Any]:
         user_data = user_doc.to_dict()
-        
-        # Apply the conversion to the entire user_data dictionary once, immediately after fetching.
-        user_data = _convert_firestore_timestamps(user_data) 
+        collection_docs = self._stream_collections_parallel(
+            user_doc_ref, self._collections_to_fetch(user_data, get_optimized)
+        )
+        # Timestamps stay as datetime objects; they are serialized to ISO 8601 only when a response is encoded.
 
         resume_data: Dict[str, Any] = {}
 
@@ -148,15 +332,16 @@ class DatabaseManager:
         # these individual documents are still fetched. However, if structured_resume_data
         # already contains the full list for a section, this might be redundant or require
         # careful merging. For now, it overrides with sub-collection details.
-        for standard_key, collection_name in self._standard_to_db_collections_map.items():
+        for standard_key in self._standard_to_db_collections_map:
             if standard_key in ['skills', 'additional_sections']:
                 continue 
             
-            docs = user_doc_ref.collection(collection_name).stream()
+            if standard_key not in collection_docs:
+                continue # Already covered by structured_resume_data
+            docs = collection_docs[standard_key]
             data_list = []
             for doc in docs:
                 item_data = doc.to_dict()
-                item_data = _convert_firestore_timestamps(item_data) # Apply conversion to each sub-collection item
 
                 desc_to_use = (
                     item_data.get('optimized_description')
@@ -176,11 +361,10 @@ class DatabaseManager:
         # Skills (explicitly fetched from sub-collection even if top-level exists, for optimized_data view)
         # Note: This will override any 'skills' key from structured_resume_data fetched earlier if present.
         # This prioritizes the detailed sub-collection for the optimized view.
-        docs = user_doc_ref.collection(self._standard_to_db_collections_map['skills']).stream()
+        docs = collection_docs.get('skills', [])
         skills_dict: Dict[str, Any] = {}
         for doc in docs:
             item = doc.to_dict()
-            item = _convert_firestore_timestamps(item) # Apply conversion
             category = item.get('category')
             skill_name = item.get('skill_name')
             if category and skill_name:
@@ -191,10 +375,9 @@ class DatabaseManager:
             resume_data['skills'] = skills_dict;
 
         # Additional sections
-        docs = user_doc_ref.collection(self._standard_to_db_collections_map['additional_sections']).stream()
+        docs = collection_docs['additional_sections']
         for doc in docs:
             item = doc.to_dict()
-            item = _convert_firestore_timestamps(item) # Apply conversion
             desc_to_use = (
                 item.get('optimized_description')
                 if get_optimized and item.get('optimized_description')
@@ -217,12 +400,17 @@ class DatabaseManager:
             user_doc_ref.set({'lastUpdatedAt': firestore.SERVER_TIMESTAMP}, merge=True)
             print(f" -> Ensured user document exists for {user_uid}")
 
+            # The sub-collection reset (deletes) and re-insert (sets) are queued in one chunked batch
+            # and committed together: ceil(total_ops / 500) RPCs instead of one per document.
+            # Only document references are needed to delete, so list_documents() fetches no document bodies.
+            sub_collection_batch = _ChunkedWriteBatch(self.db)
             collections_to_delete = list(self._standard_to_db_collections_map.values())
-            for coll_name in collections_to_delete:
-                docs = user_doc_ref.collection(coll_name).stream()
-                for doc in docs:
-                    doc.reference.delete()
-            print(f" -> Cleared old resume sub-collections for user {user_uid}")
+            def list_doc_refs(coll_name: str) -> list:
+                return list(user_doc_ref.collection(coll_name).list_documents())
+            # The seven listings are independent, so they run concurrently on the shared executor.
+            for doc_refs in self._executor.map(list_doc_refs, collections_to_delete):
+                for doc_ref in doc_refs:
+                    sub_collection_batch.delete(doc_ref)
 
             p_info = parsed_data.get('personal_info', {})
             
@@ -245,9 +433,6 @@ class DatabaseManager:
             if 'resume' in filtered_update_fields and isinstance(filtered_update_fields['resume'], dict):
                 filtered_update_fields['resume'] = {k: v for k, v in filtered_update_fields['resume'].items() if v is not None}
             
-            user_doc_ref.update(filtered_update_fields)
-            print(f" -> Updated main user document for {user_uid} with personal info, raw text, metadata, structured data, and summary.")
-
             for ai_section_key, section_content in parsed_data.items():
                 if ai_section_key in ['personal_info', 'summary', 'skills', 'resume_metadata', 'raw_text', 'optimized_summary']:
                     continue
@@ -263,14 +448,22 @@ class DatabaseManager:
                                 if 'description' in item_to_save:
                                     item_to_save['description'] = _stringify_list_content(item_to_save['description'])
                                 item_to_save['optimized_description'] = None
-                                user_doc_ref.collection(collection_name).add(item_to_save)
+                                # .document() with no ID generates the ID client-side (no allocation round trip).
+                                sub_collection_batch.set(user_doc_ref.collection(collection_name).document(), item_to_save)
                 else: # For custom/additional sections
                     description = _stringify_list_content(section_content)
-                    user_doc_ref.collection(self._standard_to_db_collections_map['additional_sections']).add({
+                    sub_collection_batch.set(user_doc_ref.collection(self._standard_to_db_collections_map['additional_sections']).document(), {
                         'section_name': ai_section_key,
                         'description': description,
                         'optimized_description': None
                     })
+
+            # The sub-collection chunks touch disjoint documents (inserts use fresh IDs, deletes only
+            # existing ones), so they commit concurrently. The main doc update goes strictly last:
+            # its new update_time is what tells fetch_resume_relational (in any worker) the write is complete.
+            sub_collection_batch.commit(executor=self._executor)
+            user_doc_ref.update(filtered_update_fields)
+            print(f" -> Updated main user document for {user_uid} with personal info, raw text, metadata, structured data, and summary.")
             
             # Skills are saved as a top-level field 'categorized_skills', no longer separate sub-collection
             # if 'skills' in parsed_data and isinstance(parsed_data['skills'], dict):
@@ -279,94 +472,104 @@ class DatabaseManager:
             #             for skill_name in skill_list:
             #                 user_doc_ref.collection(self._standard_to_db_collections_map['skills']).add({'category': category, 'skill_name': skill_name})
             
-            print(f" -> Successfully re-inserted new resume sub-collection data for user {user_uid}.")
+            print(f" -> Cleared and re-inserted resume sub-collection data for user {user_uid}.")
             return True
 
         except Exception as e:
             print(f"Error updating resume for user {user_uid}: {e}")
             return False
+        finally:
+            self._invalidate_resume_cache(user_uid)
 
     # REMOVED: update_resume_metadata function (no longer needed)
 
     def update_optimized_resume_relational(self, user_uid: str, optimized_data: Dict[str, Any]):
         user_doc_ref = self.db.collection('users').document(user_uid)
+        # All writes below go into one chunked batch, committed once at the end.
+        batch = _ChunkedWriteBatch(self.db)
 
+        # The user doc is written last (see the end of this method), so its update_time only moves
+        # once every sub-collection chunk has committed.
+        main_doc_update = {'lastUpdatedAt': firestore.SERVER_TIMESTAMP}
         # Update the summary field in the top-level structured_resume_data
         if 'summary' in optimized_data:
-            user_doc_ref.update({'structured_resume_data.summary': optimized_data['summary']})
-            user_doc_ref.update({'structured_resume_data.optimized_summary': optimized_data['summary']}) # Store optimized summary directly
+            main_doc_update['structured_resume_data.summary'] = optimized_data['summary']
+            main_doc_update['structured_resume_data.optimized_summary'] = optimized_data['summary'] # Store optimized summary directly
+
+        # This part matches optimized items to their sub-collection documents and updates 'optimized_description'.
+        # Each sub-collection is read ONCE (projected to the match keys) and matched in memory,
+        # instead of running one query per item. The reads run concurrently on the shared executor;
+        # each returns its (doc_ref, update) pairs and only this thread touches the batch.
+        def match_optimized_descriptions(collection_name: str, items: list, match_keys: list) -> list:
+            updates = []
+            candidates = [
+                (doc.to_dict(), doc.reference)
+                for doc in user_doc_ref.collection(collection_name).select(match_keys).stream()
+            ]
+            index = {}
+            for doc_data, doc_ref in candidates:
+                index.setdefault(tuple(doc_data.get(k) for k in match_keys), doc_ref)
 
-        # This part iterates sub-collections and updates 'optimized_description'
-        def update_item_optimized_description(collection_name: str, items: list, match_keys: list):
             for item_to_match in items:
-                optimized_desc_str = _stringify_list_content(item_to_match.get('description', []))
-                
-                query = user_doc_ref.collection(collection_name)
-                for key in match_keys:
-                    if item_to_match.get(key):
-                        query = query.where(key, '==', item_to_match.get(key))
-                
-                docs = query.limit(1).stream()
-                for doc in docs:
-                    doc.reference.update({'optimized_description': optimized_desc_str})
-
-        if 'work_experience' in optimized_data: update_item_optimized_description(self._standard_to_db_collections_map['work_experience'], optimized_data['work_experience'], ['role', 'company'])
-        if 'education' in optimized_data: update_item_optimized_description(self._standard_to_db_collections_map['education'], optimized_data['education'], ['institution', 'degree'])
-        if 'projects' in optimized_data: update_item_optimized_description(self._standard_to_db_collections_map['projects'], optimized_data['projects'], ['title'])
-        if 'internships' in optimized_data: update_item_optimized_description(self._standard_to_db_collections_map['internships'], optimized_data['internships'], ['role', 'company'])
-        if 'certifications' in optimized_data: update_item_optimized_description(self._standard_to_db_collections_map['certifications'], optimized_data['certifications'], ['name'])
-
-        for key, content in optimized_data.items():
-            if self._map_ai_section_to_standard_key(key) is None and key not in ['personal_info', 'summary', 'skills', 'resume_metadata', 'raw_text', 'structured_resume_data', 'categorized_skills', 'optimized_summary']:
-                optimized_desc_str = _stringify_list_content(content)
-                docs = user_doc_ref.collection(self._standard_to_db_collections_map['additional_sections']).where('section_name', '==', key).limit(1).stream()
-                for doc in docs:
-                    doc.reference.update({'optimized_description': optimized_desc_str})
+                wanted = {key: item_to_match.get(key) for key in match_keys if item_to_match.get(key)}
+                if len(wanted) == len(match_keys):
+                    doc_ref = index.get(tuple(wanted[k] for k in match_keys))
+                else: # Partial keys: same semantics as the old query, which only filtered on keys present
+                    doc_ref = next((ref for data, ref in candidates if all(data.get(k) == v for k, v in wanted.items())), None)
+                if doc_ref is not None:
+                    updates.append((doc_ref, {'optimized_description': _stringify_list_content(item_to_match.get('description', []))}))
+            return updates
+
+        section_match_keys = {
+            'work_experience': ['role', 'company'],
+            'education': ['institution', 'degree'],
+            'projects': ['title'],
+            'internships': ['role', 'company'],
+            'certifications': ['name'],
+        }
+        section_futures = [
+            self._executor.submit(match_optimized_descriptions, self._standard_to_db_collections_map[key], optimized_data[key], match_keys)
+            for key, match_keys in section_match_keys.items() if key in optimized_data
+        ]
+
+        custom_sections = {
+            key: content for key, content in optimized_data.items()
+            if self._map_ai_section_to_standard_key(key) is None and key not in ['personal_info', 'summary', 'skills', 'resume_metadata', 'raw_text', 'structured_resume_data', 'categorized_skills', 'optimized_summary']
+        }
+        if custom_sections:
+            section_refs = {}
+            for doc in user_doc_ref.collection(self._standard_to_db_collections_map['additional_sections']).select(['section_name']).stream():
+                section_refs.setdefault(doc.to_dict().get('section_name'), doc.reference)
+            for key, content in custom_sections.items():
+                if key in section_refs:
+                    batch.update(section_refs[key], {'optimized_description': _stringify_list_content(content)})
+
+        for future in section_futures:
+            for doc_ref, update in future.result():
+                batch.update(doc_ref, update)
         
-        user_doc_ref.update({'lastUpdatedAt': firestore.SERVER_TIMESTAMP})
+        batch.update(user_doc_ref, main_doc_update) # Last op, so it lands in the last chunk
+        try:
+            batch.commit() # Chunks commit sequentially, in order
+        finally:
+            self._invalidate_resume_cache(user_uid)
         print(f" -> Optimized data for user UID {user_uid} has been fully updated in Firestore.")
 
     def close_connection(self):
-        pass
+        self._executor.shutdown(wait=False)
 
 
     # NEW/MODIFIED: Function to safely increment user statistics
     def increment_user_stat(self, uid: str, stat_name: str, increment_by: int = 1):
+        """
+        Increments a single stat with one blind write (no read first).
+        The 'stats' map is written with the user doc at signup. set(merge=True) only
+        touches `stat_name` (same single RPC as update('stats.<name>')) but also works for
+        older users whose doc has no 'stats' yet; missing stats are defaulted to 0 on read.
+        """
         user_doc_ref = self.db.collection('users').document(uid)
         try:
-            # Check if 'stats' map exists and is a dictionary
-            user_doc = user_doc_ref.get()
-            if not user_doc.exists:
-                # If document doesn't exist, create it with initial stats
-                print(f"ℹ️ User document for {uid} does not exist. Creating with initial stats.")
-                user_doc_ref.set({
-                    'stats': {
-                        'roadmaps_generated': 0,
-                        'resumes_optimized': 0,
-                        'assessments_taken': 0,
-                        'jobs_matched': 0,
-                        stat_name: firestore.Increment(increment_by) # Include current increment
-                    }
-                })
-            else:
-                user_data = user_doc.to_dict()
-                if 'stats' not in user_data or not isinstance(user_data['stats'], dict):
-                    # If 'stats' is missing or not a dict, initialize it safely
-                    print(f"ℹ️ 'stats' field missing or malformed for {uid}. Initializing and setting stat.")
-                    user_doc_ref.update({
-                        'stats': {
-                            'roadmaps_generated': 0,
-                            'resumes_optimized': 0,
-                            'assessments_taken': 0,
-                            'jobs_matched': 0,
-                            stat_name: firestore.Increment(increment_by) # Include current increment
-                        }
-                    })
-                else:
-                    # 'stats' map exists, proceed with incrementing the specific field
-                    user_doc_ref.update({
-                        f'stats.{stat_name}': firestore.Increment(increment_by)
-                    })
+            user_doc_ref.set({'stats': {stat_name: firestore.Increment(increment_by)}}, merge=True)
             print(f"✅ Incremented stat '{stat_name}' for user {uid} by {increment_by}.")
         except Exception as e:
             print(f"❌ Critical Error incrementing stat '{stat_name}' for user {uid}: {e}")
@@ -388,86 +591,188 @@ class DatabaseManager:
 
 
 
-    # MODIFIED LOGIC: This function now deletes all previous roadmaps before creating the new one.
-    async def save_user_roadmap(self, user_uid: str, new_roadmap_data: Dict[str, Any]) -> bool:
-        """
-        Ensures only one roadmap exists by deleting all previous roadmap documents
-        for the user before creating the new one.
-        """
+    # The user's one and only roadmap lives at a fixed document ID, so saving is an idempotent
+    # overwrite and reading is a direct document get (no collection query, no delete loop).
+    _roadmap_doc_id = 'current'
+
+    def _get_roadmap_snapshot(self, user_uid: str):
+        """Returns the roadmap snapshot, falling back to a legacy auto-ID document saved before the fixed ID existed."""
+        roadmaps_collection = self.db.collection('users').document(user_uid).collection('roadmaps')
+        snapshot = roadmaps_collection.document(self._roadmap_doc_id).get()
+        if snapshot.exists:
+            return snapshot
+        return next(roadmaps_collection.limit(1).stream(), None)
+
+    def _save_and_record_roadmap_sync(self, user_uid: str, new_roadmap_data: Dict[str, Any]) -> bool:
+        """Saves the roadmap and bumps 'roadmaps_generated' in one WriteBatch: a single commit RPC."""
         try:
-            roadmaps_collection = self.db.collection('users').document(user_uid).collection('roadmaps')
-            
-            # Step 1: Find and delete all existing documents in the sub-collection.
-            existing_docs = roadmaps_collection.stream()
-            for doc in existing_docs:
-                print(f"  -> Deleting old roadmap document: {doc.id}")
-                doc.reference.delete()
-
-            # Step 2: Create the new roadmap document.
-            data_to_add = {
+            user_doc_ref = self.db.collection('users').document(user_uid)
+            batch = self.db.batch()
+            batch.set(user_doc_ref.collection('roadmaps').document(self._roadmap_doc_id), {
                 'createdAt': firestore.SERVER_TIMESTAMP,
-                **new_roadmap_data
-            }
-            roadmaps_collection.add(data_to_add)
-            
-            print(f"✅ New roadmap created after clearing previous for user {user_uid}.")
+                **new_roadmap_data,
+                'task_index': _build_task_index(new_roadmap_data.get('detailed_roadmap')),
+            })
+            batch.set(user_doc_ref, {'stats': {'roadmaps_generated': firestore.Increment(1)}}, merge=True)
+            batch.commit()
+
+            print(f"✅ New roadmap saved and recorded for user {user_uid}.")
             return True
         except Exception as e:
-            print(f"❌ Error during delete-then-create for roadmap (user: {user_uid}): {e}")
+            print(f"❌ Error saving roadmap (user: {user_uid}): {e}")
             raise
 
-    # This function now correctly finds the one and only roadmap document.
-    async def get_user_roadmap(self, user_uid: str) -> Optional[Dict[str, Any]]:
+    def _get_user_roadmap_sync(self, user_uid: str) -> Optional[Dict[str, Any]]:
         """Retrieves the single roadmap document for a user."""
         try:
-            roadmaps_collection = self.db.collection('users').document(user_uid).collection('roadmaps')
-            # Since there's only one, we can just get the first result from the stream.
-            docs = roadmaps_collection.limit(1).stream()
-            the_only_roadmap_doc = next(docs, None)
+            the_only_roadmap_doc = self._get_roadmap_snapshot(user_uid)
 
             if the_only_roadmap_doc:
-                return the_only_roadmap_doc.to_dict()
+                return _apply_task_status(the_only_roadmap_doc.to_dict())
             else:
                 return None
         except Exception as e:
             print(f"❌ Error fetching the roadmap for user {user_uid}: {e}")
             raise
 
-    # This function also correctly finds and updates the one and only roadmap document.
-    async def update_roadmap_task_status(self, user_uid: str, phase_title: str, topic_name: str, is_completed: bool) -> bool:
-        """Finds the single roadmap document and updates a task's status."""
+    @staticmethod
+    def _task_status_field(phase_index: int, topic_name: str) -> str:
+        """Update key for task_status.<phase_index>.<topic_name>; FieldPath quotes the segments ('0', names with '.', spaces, etc.) so each stays a single path segment."""
+        return FieldPath('task_status', str(phase_index), topic_name).to_api_repr()
+
+    def _update_roadmap_task_status_sync(self, user_uid: str, phase_title: str, topic_name: str, is_completed: bool, phase_index: Optional[int] = None) -> bool:
+        """
+        Records a task's status as one field-path write to task_status.<phase_index>.<topic_name>
+        on the roadmap document. The task is validated against the small 'task_index' field, read
+        with a projection, so the full roadmap is never transferred. Read and write share a
+        transaction, so a roadmap regenerated in between can't get a status for a task it no longer has.
+        Unknown tasks return False. _get_user_roadmap_sync overlays the map onto 'detailed_roadmap'.
+        """
+        roadmap_doc_ref = self.db.collection('users').document(user_uid).collection('roadmaps').document(self._roadmap_doc_id)
+
+        @firestore.transactional
+        def mark_task(transaction) -> Optional[bool]:
+            snapshot = roadmap_doc_ref.get(field_paths=['task_index'], transaction=transaction)
+            task_index = (snapshot.to_dict() or {}).get('task_index') if snapshot.exists else None
+            if task_index is None:
+                return None # No fixed-ID roadmap, or one saved before the task index existed
+            found_phase = _find_task_phase(task_index, phase_title, topic_name, phase_index)
+            if found_phase is None:
+                return False
+            transaction.update(roadmap_doc_ref, {self._task_status_field(found_phase, topic_name): is_completed})
+            return True
+
         try:
-            roadmaps_collection = self.db.collection('users').document(user_uid).collection('roadmaps')
-            docs = roadmaps_collection.limit(1).stream()
-            the_only_roadmap_doc = next(docs, None)
+            task_updated = mark_task(self.db.transaction())
+            if task_updated is None:
+                return self._update_legacy_roadmap_task_status(user_uid, phase_title, topic_name, is_completed, phase_index)
+            if task_updated:
+                print(f"✅ Task '{topic_name}' updated for user {user_uid}.")
+            return task_updated
+        except Exception as e:
+            print(f"❌ Error updating roadmap task status for user {user_uid}: {e}")
+            raise
 
+    # This function also correctly finds and updates the one and only roadmap document.
+    def _update_legacy_roadmap_task_status(self, user_uid: str, phase_title: str, topic_name: str, is_completed: bool, phase_index: Optional[int] = None) -> bool:
+        """
+        Finds the single roadmap document and updates a task's status.
+        The read-modify-write of 'detailed_roadmap' runs in a transaction, so concurrent
+        toggles on the same roadmap can't overwrite each other. Used for roadmaps saved before
+        'task_index' existed; the write backfills the index so later toggles take the fast path.
+        """
+        roadmaps_collection = self.db.collection('users').document(user_uid).collection('roadmaps')
+
+        @firestore.transactional
+        def toggle_task(transaction) -> Optional[bool]:
+            the_only_roadmap_doc = roadmaps_collection.document(self._roadmap_doc_id).get(transaction=transaction)
+            if not the_only_roadmap_doc.exists: # Legacy auto-ID roadmap
+                the_only_roadmap_doc = next(roadmaps_collection.limit(1).stream(transaction=transaction), None)
             if not the_only_roadmap_doc:
-                print(f"❌ No roadmap document found for user {user_uid}. Cannot update.")
-                return False
+                return None
 
             roadmap_content = the_only_roadmap_doc.to_dict()
-            doc_ref = the_only_roadmap_doc.reference
-
             if 'detailed_roadmap' not in roadmap_content: return False
 
             updated_detailed_roadmap = roadmap_content['detailed_roadmap']
-            task_found_and_updated = False
-            for phase in updated_detailed_roadmap:
-                if phase.get('phase_title') == phase_title and isinstance(phase.get('topics'), list):
+            for i, phase in enumerate(updated_detailed_roadmap):
+                is_target_phase = i == phase_index if phase_index is not None else phase.get('phase_title') == phase_title
+                if is_target_phase and isinstance(phase.get('topics'), list):
                     for topic in phase['topics']:
                         if isinstance(topic, dict) and topic.get('name') == topic_name:
                             topic['is_completed'] = is_completed
-                            task_found_and_updated = True
-                            break
-                if task_found_and_updated:
-                    break
+                            transaction.update(the_only_roadmap_doc.reference, {
+                                'detailed_roadmap': updated_detailed_roadmap,
+                                'task_index': _build_task_index(updated_detailed_roadmap),
+                            })
+                            return True
+            return False
 
-            if task_found_and_updated:
-                doc_ref.update({'detailed_roadmap': updated_detailed_roadmap})
-                print(f"✅ Task '{topic_name}' updated for user {user_uid}.")
-                return True
-            else:
+        try:
+            task_updated = toggle_task(self.db.transaction())
+            if task_updated is None:
+                print(f"❌ No roadmap document found for user {user_uid}. Cannot update.")
                 return False
+            if task_updated:
+                print(f"✅ Task '{topic_name}' updated for user {user_uid}.")
+            return task_updated
         except Exception as e:
             print(f"❌ Error updating roadmap task status for user {user_uid}: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    # --- Tutor explanation cache ---
+    # Shared across instances: tutor_cache/{sha256(topic_key)}. Entries carry an 'expiresAt'; reads
+    # ignore expired entries, and a Firestore TTL policy on that field can garbage-collect them.
+    tutor_cache_ttl = timedelta(days=30)
+
+    def _tutor_cache_ref(self, topic_key: str):
+        return self.db.collection('tutor_cache').document(hashlib.sha256(topic_key.encode('utf-8')).hexdigest())
+
+    def _get_cached_tutor_explanation_sync(self, topic_key: str) -> Optional[Dict[str, Any]]:
+        try:
+            snapshot = self._tutor_cache_ref(topic_key).get()
+        except Exception as e:
+            print(f"⚠️ Could not read tutor cache for '{topic_key}': {e}")
+            return None # A cache miss, not an error
+        if not snapshot.exists:
+            return None
+        entry = snapshot.to_dict()
+        expires_at = entry.get('expiresAt')
+        if expires_at and expires_at < datetime.now(timezone.utc):
+            return None
+        return entry.get('explanation')
+
+    def save_tutor_explanation(self, topic_key: str, explanation: Dict[str, Any]):
+        try:
+            self._tutor_cache_ref(topic_key).set({
+                'topic': topic_key,
+                'explanation': explanation,
+                'expiresAt': datetime.now(timezone.utc) + self.tutor_cache_ttl,
+            })
+        except Exception as e:
+            print(f"⚠️ Could not write tutor cache for '{topic_key}': {e}")
+
+    # --- Async entry points ---
+    # The Admin SDK client used here is synchronous. These wrappers run the blocking
+    # Firestore work in a worker thread so async route handlers don't stall the event loop.
+    # run_in_threadpool (not asyncio.to_thread) so they share the AnyIO limiter main.py sizes.
+    async def get_user_doc(self, user_uid: str):
+        return await run_in_threadpool(self.db.collection('users').document(user_uid).get)
+
+    async def fetch_resume_relational_async(self, user_uid: str, get_optimized: bool = False) -> Optional[Dict[str, Any]]:
+        return await run_in_threadpool(self.fetch_resume_relational, user_uid, get_optimized)
+
+    async def update_resume_relational_async(self, user_uid: str, parsed_data: Dict[str, Any]) -> bool:
+        return await run_in_threadpool(self.update_resume_relational, user_uid, parsed_data)
+
+    async def save_and_record_roadmap(self, user_uid: str, new_roadmap_data: Dict[str, Any]) -> bool:
+        return await run_in_threadpool(self._save_and_record_roadmap_sync, user_uid, new_roadmap_data)
+
+    async def get_cached_tutor_explanation(self, topic_key: str) -> Optional[Dict[str, Any]]:
+        return await run_in_threadpool(self._get_cached_tutor_explanation_sync, topic_key)
+
+    async def get_user_roadmap(self, user_uid: str) -> Optional[Dict[str, Any]]:
+        return await run_in_threadpool(self._get_user_roadmap_sync, user_uid)
+
+    async def update_roadmap_task_status(self, user_uid: str, phase_title: str, topic_name: str, is_completed: bool, phase_index: Optional[int] = None) -> bool:
+        return await run_in_threadpool(self._update_roadmap_task_status_sync, user_uid, phase_title, topic_name, is_completed, phase_index)
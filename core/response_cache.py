@@ -0,0 +1,67 @@
+# backend/core/response_cache.py
+import hashlib
+import logging
+from typing import Optional, Dict, Any, List
+
+import orjson
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Chatbot replies are cached briefly: long enough to absorb repeated questions
+# ("what should I learn next?") against the same plan, short enough to stay fresh.
+CHAT_RESPONSE_TTL_SECONDS = 300
+# Only the tail of the conversation is part of the key; older turns rarely change the answer.
+CHAT_HISTORY_TAIL = 4
+
+
+def chat_cache_key(plan_summary: str, query: str, history: List[Dict[str, str]]) -> str:
+    """Key for a chatbot reply: (career plan summary, normalized query, last few history messages)."""
+    digest = hashlib.blake2b(
+        orjson.dumps([plan_summary, query.lower().strip(), history[-CHAT_HISTORY_TAIL:]]),
+        digest_size=16,
+    ).hexdigest()
+    return f"chat:{digest}"
+
+
+class ResponseCache:
+    """
+    Async get/set of JSON-serializable values with a fixed TTL.
+    Backed by Redis when REDIS_URL is configured (shared across workers and instances),
+    otherwise by an in-process TTLCache. Cache errors are logged and treated as misses.
+    """
+    def __init__(self, redis_url: Optional[str] = None, ttl: int = CHAT_RESPONSE_TTL_SECONDS):
+        self.ttl = ttl
+        self._redis = None
+        self._local = None
+        if redis_url:
+            import redis.asyncio as redis # Only needed when Redis is actually configured
+            self._redis = redis.from_url(redis_url)
+            logger.info("✅ Response cache: using Redis.")
+        else:
+            # Only touched from the event loop thread, so no lock is needed.
+            self._local = TTLCache(maxsize=4096, ttl=ttl)
+            logger.info("ℹ️ Response cache: REDIS_URL not set, using in-process cache.")
+
+    async def get(self, key: str) -> Optional[Any]:
+        if self._local is not None:
+            return self._local.get(key)
+        try:
+            cached = await self._redis.get(key)
+        except Exception as e:
+            logger.warning("⚠️ Response cache read failed: %s", e)
+            return None
+        return orjson.loads(cached) if cached is not None else None
+
+    async def set(self, key: str, value: Any):
+        if self._local is not None:
+            self._local[key] = value
+            return
+        try:
+            await self._redis.setex(key, self.ttl, orjson.dumps(value))
+        except Exception as e:
+            logger.warning("⚠️ Response cache write failed: %s", e)
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
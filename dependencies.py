@@ -10,24 +10,24 @@ backend_dir = current_file_dir
 if str(backend_dir) not in sys.path:
     sys.path.insert(0, str(backend_dir))
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
+from fastapi.concurrency import run_in_threadpool
 from firebase_admin import auth
-from typing import Dict, Any, Optional
+from typing import Dict, Any
 
 from core.db_core import DatabaseManager # Now can import directly
-import firebase_admin
+from core.response_cache import ResponseCache
 
 # --- DatabaseManager Dependency ---
-_db_manager_instance: Optional[DatabaseManager] = None
+def get_db_manager(request: Request) -> DatabaseManager:
+    """Returns the process-wide DatabaseManager created once in main.py (app.state.db_manager)."""
+    return request.app.state.db_manager
 
-def get_db_manager() -> DatabaseManager:
-    global _db_manager_instance
-    if _db_manager_instance is None:
-        if not firebase_admin._apps:
-            raise RuntimeError("Firebase Admin SDK not initialized. Ensure firebase_admin.initialize_app() is called in main.py first.")
-        _db_manager_instance = DatabaseManager()
-    return _db_manager_instance
+# --- Response Cache Dependency ---
+def get_response_cache(request: Request) -> ResponseCache:
+    """Returns the process-wide ResponseCache created in main.py's lifespan (app.state.response_cache)."""
+    return request.app.state.response_cache
 
 # --- Authentication Dependency ---
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token") 
@@ -35,7 +35,8 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
     """A dependency that verifies the Firebase ID token on protected endpoints."""
     try:
-        decoded_token = auth.verify_id_token(token)
+        # May fetch Google's signing certificates over the network, so it runs in the threadpool.
+        decoded_token = await run_in_threadpool(auth.verify_id_token, token)
         return decoded_token
     except Exception as e:
         print(f"Auth error in get_current_user: {e}")
@@ -1,44 +1,91 @@
 # main.py
 import os
-import json
-import sys
+import orjson
+import logging
 from pathlib import Path
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import anyio.to_thread
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import firebase_admin
 from firebase_admin import credentials, initialize_app
 
+# Set LOG_LEVEL=DEBUG locally for diagnostic output; production runs at INFO or WARNING.
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
 # ------------------------------
 # Firebase Admin SDK Initialization
 # ------------------------------
-if not firebase_admin._apps:
-    try:
-        firebase_creds = os.environ.get("FIREBASE_CREDENTIALS")
-        if firebase_creds:
-            # Load credentials from environment variable (Render/Production)
-            cred_dict = json.loads(firebase_creds)
-            cred = credentials.Certificate(cred_dict)
-        else:
-            # Fallback to local JSON file (for local dev)
-            credentials_path = Path(__file__).parent / "firebase-credentials.json"
-            if not credentials_path.exists():
-                raise FileNotFoundError(
-                    f"'firebase-credentials.json' not found at {credentials_path}"
-                )
-            cred = credentials.Certificate(credentials_path)
-        
-        initialize_app(cred)
-        print("✅ Firebase Admin SDK initialized successfully.")
-    except Exception as e:
-        print(f"❌ Failed to initialize Firebase Admin SDK: {e}")
-        sys.exit(1)
-else:
-    print("ℹ️ Firebase Admin SDK already initialized.")
+@lru_cache(maxsize=1)
+def get_firebase_app() -> firebase_admin.App:
+    """
+    Initializes the Firebase Admin SDK on first call and returns the default app.
+    Cached, so the env var / credentials file are only read once per process.
+    """
+    if firebase_admin._apps:
+        logger.info("ℹ️ Firebase Admin SDK already initialized.")
+        return firebase_admin.get_app()
+
+    firebase_creds = os.environ.get("FIREBASE_CREDENTIALS")
+    if firebase_creds:
+        # Load credentials from environment variable (Render/Production)
+        cred = credentials.Certificate(orjson.loads(firebase_creds))
+    else:
+        # Fallback to local JSON file (for local dev); only looked up when the env var is missing.
+        credentials_path = Path(__file__).parent / "firebase-credentials.json"
+        if not credentials_path.exists():
+            raise FileNotFoundError(
+                f"'firebase-credentials.json' not found at {credentials_path}"
+            )
+        cred = credentials.Certificate(credentials_path)
+
+    firebase_app = initialize_app(cred)
+    logger.info("✅ Firebase Admin SDK initialized successfully.")
+    return firebase_app
 
 # ------------------------------
 # FastAPI App Setup
 # ------------------------------
-app = FastAPI(title="AI Career Coach API", version="2.0.0")
+# Concurrent run_in_threadpool calls (blocking Gemini / Firestore / Adzuna requests) allowed per worker.
+# AnyIO's default of 40 would queue requests that are only waiting on the network.
+THREADPOOL_MAX_THREADS = 64
+
+from core.db_core import DatabaseManager
+from core.response_cache import ResponseCache
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_MAX_THREADS
+    try:
+        get_firebase_app()
+    except Exception as e:
+        logger.critical("❌ Failed to initialize Firebase Admin SDK: %s", e)
+        raise # Aborts startup
+    # One DatabaseManager (and so one Firestore client / gRPC channel pool and one
+    # executor) for the whole process, handed to routes via dependencies.get_db_manager.
+    app.state.db_manager = DatabaseManager()
+    # Chatbot reply cache: Redis when REDIS_URL is set, in-process otherwise.
+    app.state.response_cache = ResponseCache(os.environ.get("REDIS_URL"))
+    yield
+    app.state.db_manager.close_connection()
+    await app.state.response_cache.close()
+
+# ORJSONResponse: responses are serialized by orjson instead of the stdlib json module.
+app = FastAPI(title="AI Career Coach API", version="2.0.0", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Registered before CORSMiddleware so it runs inside it: the 500 it returns still gets the
+# Access-Control-Allow-Origin header (an exception_handler(Exception) runs outside CORS and loses it).
+@app.middleware("http")
+async def unhandled_exception_middleware(request: Request, call_next):
+    try:
+        return await call_next(request)
+    except Exception:
+        # One place for unexpected errors: full traceback in the logs, no internals in the response body.
+        logger.exception("Unhandled error on %s %s", request.method, request.url.path)
+        return ORJSONResponse({"detail": "Internal server error"}, status_code=500)
 
 # CORS configuration
 origins = [
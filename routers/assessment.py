@@ -10,7 +10,8 @@ backend_dir = current_file_dir.parent # Go up one level from 'routers' to 'backe
 if str(backend_dir) not in sys.path:
     sys.path.insert(0, str(backend_dir))
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from typing import Dict, Any, Optional, List, Union
 
@@ -40,6 +41,7 @@ class AssessmentSubmissionRequest(BaseModel):
 @router.post("/start")
 async def start_assessment_endpoint(
     request: AssessmentSetupRequest,
+    background_tasks: BackgroundTasks,
     user: dict = Depends(get_current_user),
     db: DatabaseManager = Depends(get_db_manager)
 ):
@@ -48,7 +50,8 @@ async def start_assessment_endpoint(
     
     try:
         # Generate questions using AI_CORE
-        questions_output = generate_assessment_questions(
+        questions_output = await run_in_threadpool(
+            generate_assessment_questions,
             assessment_type=request.assessment_type,
             skills=request.skills,
             target_role=request.target_role,
@@ -66,7 +69,7 @@ async def start_assessment_endpoint(
         #     'created_at': firestore.SERVER_TIMESTAMP
         # })
         # return {"assessment_session_id": assessment_doc_ref.id, "questions": questions_output['questions']}
-        db.record_assessment_taken(uid)
+        background_tasks.add_task(db.record_assessment_taken, uid) # Counter write runs after the response is sent
         return {"questions": questions_output['questions']}
         
     except Exception as e:
@@ -84,9 +87,10 @@ async def submit_assessment_endpoint(
 
     try:
         # Convert List[UserAnswer] to List[Dict] for ai_core function
-        submitted_answers_as_dicts = [ans.dict() for ans in request.answers] # <--- CRITICAL FIX HERE
+        submitted_answers_as_dicts = request.model_dump(include={'answers'})['answers'] # <--- CRITICAL FIX HERE
 
-        results_output = evaluate_assessment_answers(
+        results_output = await run_in_threadpool(
+            evaluate_assessment_answers,
             user_id=uid,
             submitted_answers=submitted_answers_as_dicts, # Pass the list of dictionaries
             # original_questions=original_assessment_data.get('questions') # Pass if needed for evaluation
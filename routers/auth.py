@@ -10,6 +10,7 @@ if str(backend_dir) not in sys.path:
     sys.path.insert(0, str(backend_dir))
 
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, EmailStr
 import firebase_admin
 from firebase_admin import auth, firestore
@@ -40,7 +41,9 @@ class UserEmailLogin(BaseModel):
 async def signup_with_email(user_data: UserCreate, db: DatabaseManager = Depends(get_db_manager)):
     """Handles new user registration with email and password."""
     try:
-        user = auth.create_user(
+        # The Admin SDK calls below are blocking network round trips, so they run in the threadpool.
+        user = await run_in_threadpool(
+            auth.create_user,
             email=user_data.email,
             password=user_data.password,
             display_name=user_data.name
@@ -49,7 +52,7 @@ async def signup_with_email(user_data: UserCreate, db: DatabaseManager = Depends
         print(f"Successfully created new user: {user_data.name} ({uid})")
 
         users_ref = db.db.collection('users')
-        users_ref.document(uid).set({
+        await run_in_threadpool(users_ref.document(uid).set, {
             'uid': uid,
             'email': user_data.email,
             'name': user_data.name,
@@ -61,6 +64,7 @@ async def signup_with_email(user_data: UserCreate, db: DatabaseManager = Depends
                 'summary': None,
                 'optimized_summary': None
             },
+            'stats': dict(DatabaseManager.default_user_stats),
             'createdAt': firestore.SERVER_TIMESTAMP
         })
         print(f"User profile created in Firestore for {uid}")
@@ -76,16 +80,15 @@ async def signup_with_email(user_data: UserCreate, db: DatabaseManager = Depends
 @router.post("/login")
 async def login_with_google(user_data: UserLogin, db: DatabaseManager = Depends(get_db_manager)):
     try:
-        decoded_token = auth.verify_id_token(user_data.id_token)
+        decoded_token = await run_in_threadpool(auth.verify_id_token, user_data.id_token)
         uid = decoded_token['uid']
         email = decoded_token.get('email')
         name = decoded_token.get('name', 'Anonymous')
 
-        users_ref = db.db.collection('users')
-        user_doc = users_ref.document(uid).get()
+        user_doc = await db.get_user_doc(uid)
 
         if not user_doc.exists:
-            users_ref.document(uid).set({
+            await run_in_threadpool(db.db.collection('users').document(uid).set, {
                 'uid': uid,
                 'email': email,
                 'name': name,
@@ -97,6 +100,7 @@ async def login_with_google(user_data: UserLogin, db: DatabaseManager = Depends(
                     'summary': None,
                     'optimized_summary': None
                 },
+                'stats': dict(DatabaseManager.default_user_stats),
                 'createdAt': firestore.SERVER_TIMESTAMP
             })
             print(f"New user created in Firestore via Google: {name} ({uid})")
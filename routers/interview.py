@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict
+from typing import List, Dict, Optional
 
 # --- We now need TWO functions from ai_core ---
-from core.ai_core import get_interview_chat_response, get_interview_summary
+from core.ai_core import get_interview_chat_response, get_interview_summary, stream_interview_chat_response, to_sse_events
 
 router = APIRouter(
     tags=["Mock Interview"]
@@ -17,6 +19,7 @@ class ChatMessage(BaseModel):
     content: str
 
 class ChatRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
     job_description: str
     chat_history: List[ChatMessage]
     difficulty: str
@@ -25,8 +28,12 @@ class ChatResponse(BaseModel):
     reply: str
 
 class SummarizeRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
     job_description: str
-    chat_history: List[ChatMessage]
+    chat_history: List[ChatMessage] = []
+    # Optional transcript kept by the client, one "role: content" line appended per turn.
+    # When present the server skips rebuilding it from chat_history.
+    transcript: Optional[str] = None
 
 class SummaryResponse(BaseModel):
     overall_score: int
@@ -43,9 +50,11 @@ async def conduct_interview_chat(request: ChatRequest):
     if not request.job_description or not request.job_description.strip():
         raise HTTPException(status_code=400, detail="Job description cannot be empty.")
 
-    response_data = get_interview_chat_response(
+    # The Gemini call blocks; running it in the threadpool keeps concurrent interviews from queuing on the event loop.
+    response_data = await run_in_threadpool(
+        get_interview_chat_response,
         job_description=request.job_description,
-        history=[msg.dict() for msg in request.chat_history],
+        history=request.model_dump(include={'chat_history'})['chat_history'], # One pass over the whole list
         difficulty=request.difficulty
     )
     
@@ -54,14 +63,29 @@ async def conduct_interview_chat(request: ChatRequest):
         
     return response_data
 
+@router.post("/chat/stream", summary="Conduct the AI Mock Interview (reply streamed as Server-Sent Events)")
+async def conduct_interview_chat_stream(request: ChatRequest):
+    if not request.job_description or not request.job_description.strip():
+        raise HTTPException(status_code=400, detail="Job description cannot be empty.")
+
+    # Lazy generator: Starlette iterates it in the threadpool and sends each chunk as Gemini produces it.
+    reply_chunks = stream_interview_chat_response(
+        job_description=request.job_description,
+        history=request.model_dump(include={'chat_history'})['chat_history'],
+        difficulty=request.difficulty
+    )
+    return StreamingResponse(to_sse_events(reply_chunks), media_type="text/event-stream")
+
 @router.post("/summarize", response_model=SummaryResponse, summary="Summarize the interview performance")
 async def summarize_interview(request: SummarizeRequest):
-    if not request.chat_history:
+    if not request.chat_history and not request.transcript:
         raise HTTPException(status_code=400, detail="Chat history cannot be empty.")
 
-    summary_data = get_interview_summary(
+    summary_data = await run_in_threadpool(
+        get_interview_summary,
         job_description=request.job_description,
-        history=[msg.dict() for msg in request.chat_history]
+        history=request.model_dump(include={'chat_history'})['chat_history'], # One pass over the whole list
+        transcript=request.transcript
     )
     
     if not summary_data:
@@ -5,6 +5,7 @@ from collections import defaultdict
 import os
 import json
 import tempfile
+import asyncio
 
 # IMPORTANT: Local sys.path adjustment for local development imports
 current_file_dir = Path(__file__).resolve().parent
@@ -13,8 +14,9 @@ if str(backend_dir) not in sys.path:
     sys.path.insert(0, str(backend_dir))
     print(f"DEBUG: Added {backend_dir} to sys.path from routers/joblisting.py") # DIAGNOSTIC PRINT
 
-from fastapi import APIRouter, File, Form, UploadFile, Query, HTTPException, Depends
+from fastapi import APIRouter, File, Form, UploadFile, Query, HTTPException, Depends, BackgroundTasks
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Dict, Any, Optional
 
 # Import job-related core logic from new modules
@@ -32,6 +34,7 @@ router = APIRouter()
 
 @router.post("/find_jobs/") # Endpoint for frontend to hit
 async def upload_resume_and_find_jobs(
+    background_tasks: BackgroundTasks,
     file: Optional[UploadFile] = File(None, description="The user's resume in PDF or DOCX format."),
     # CORRECTED: Keep use_saved_resume as Form(False) to match FormData sending from frontend
     use_saved_resume: bool = Form(False, description="Set to true to use the resume already saved in the user's profile."), 
@@ -58,7 +61,7 @@ async def upload_resume_and_find_jobs(
             file_extension = os.path.splitext(file.filename)[1].lower()
             
             # Use ai_core's extract_text_auto which handles both PDF and DOCX
-            resume_text = extract_text_auto(file_content_bytes, file_extension)
+            resume_text = await run_in_threadpool(extract_text_auto, file_content_bytes, file_extension)
             if not resume_text:
                 raise HTTPException(status_code=400, detail="Could not extract text from the uploaded resume file.")
         elif use_saved_resume:
@@ -93,7 +96,7 @@ async def upload_resume_and_find_jobs(
             raise HTTPException(status_code=400, detail="No resume file provided and 'use_saved_resume' was not set to true.")
 
 
-        user_skills = extract_skills_from_text(resume_text)
+        user_skills = await run_in_threadpool(extract_skills_from_text, resume_text)
         print(f"DEBUG: Extracted skills: {user_skills}")
 
         if not user_skills:
@@ -104,8 +107,12 @@ async def upload_resume_and_find_jobs(
         # Fetch up to 50 jobs in total to have a good pool for rating, adjust results_per_page
         adzuna_results_per_skill = max(1, 50 // (len(user_skills) if user_skills else 1)) 
         
-        for skill in user_skills:
-            job_results = fetch_jobs(skill, location=location, results_per_page=adzuna_results_per_skill)
+        # One Adzuna request per skill, all in flight at once; results keep skill order so deduplication is unchanged.
+        results_per_skill = await asyncio.gather(*(
+            run_in_threadpool(fetch_jobs, skill, location=location, results_per_page=adzuna_results_per_skill)
+            for skill in user_skills
+        ))
+        for skill, job_results in zip(user_skills, results_per_skill):
             for job in job_results:
                 job_identifier = (job.get("title"), job.get("company", {}).get("display_name"), job.get("location", {}).get("display_name"))
                 if job_identifier not in unique_jobs_dict:
@@ -118,7 +125,7 @@ async def upload_resume_and_find_jobs(
         if not unique_jobs_list:
             return JSONResponse(content={"skills": user_skills, "jobs": [], "message": f"No jobs found for your skills in {location}."})
 
-        rated_jobs = get_job_ratings_in_one_call(unique_jobs_list, user_skills)
+        rated_jobs = await run_in_threadpool(get_job_ratings_in_one_call, unique_jobs_list, user_skills)
         print(f"DEBUG: Rated {len(rated_jobs)} jobs with AI.")
 
         # --- START: MODIFIED JOB SELECTION LOGIC ---
@@ -168,7 +175,7 @@ async def upload_resume_and_find_jobs(
             formatted_jobs.append(formatted_job)
         
         print(f"DEBUG: Returning {len(formatted_jobs)} formatted jobs to frontend.")
-        db.record_jobs_matched(uid)
+        background_tasks.add_task(db.record_jobs_matched, uid) # Counter write runs after the response is sent
         return JSONResponse(content={"skills": user_skills, "jobs": formatted_jobs})
 
     except HTTPException as e:
@@ -4,9 +4,11 @@ import os
 import io 
 import json
 import re 
-from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Depends
+from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Depends, BackgroundTasks
 from pydantic import BaseModel
 from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 from fastapi import Path 
 from typing import Dict, Any, Optional
 from firebase_admin import firestore
@@ -56,10 +58,10 @@ async def get_user_optimized_resume(user_uid: str = Path(..., description="The U
         raise HTTPException(status_code=403, detail="Not authorized to access this user's resume.")
 
     try:
-        resume_data = db.fetch_resume_relational(user_uid, get_optimized=True)
+        resume_data = await db.fetch_resume_relational_async(user_uid, get_optimized=True)
         if not resume_data:
             raise HTTPException(status_code=404, detail="No resume data found for this user.")
-        return JSONResponse(content=resume_data)
+        return JSONResponse(content=jsonable_encoder(resume_data)) # Serializes Firestore timestamps as ISO 8601
     except Exception as e:
         logger.error(f"Error fetching user optimized resume for UID {user_uid}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An internal server error occurred: {str(e)}")
@@ -109,21 +111,21 @@ async def upload_and_process_resume(
                 print("ERROR: Uploaded file content is empty.")
                 raise HTTPException(status_code=400, detail="Uploaded file is empty.")
             
-            resume_text = extract_text_auto(file_content_bytes, file_extension)
+            resume_text = await run_in_threadpool(extract_text_auto, file_content_bytes, file_extension)
             print(f"DEBUG: Text extracted, length: {len(resume_text) if resume_text else 0}")
             
             if not resume_text:
                 print("ERROR: Could not extract text from the uploaded resume file.")
                 raise HTTPException(status_code=400, detail="Could not extract text from the uploaded resume file.")
             
-            final_structured_data_to_save = get_resume_structure(resume_text)
+            final_structured_data_to_save = await run_in_threadpool(get_resume_structure, resume_text)
             structure_ai_called = True # AI call made for new upload
             print(f"DEBUG: Structured data generated: {bool(final_structured_data_to_save)}")
             if not final_structured_data_to_save:
                 print("ERROR: AI failed to structure the resume.")
                 raise HTTPException(status_code=500, detail="AI failed to structure the resume from the uploaded content.")
 
-            categorized_skills = categorize_skills_from_text(resume_text)
+            categorized_skills = await run_in_threadpool(categorize_skills_from_text, resume_text)
             skills_ai_called = True # AI call made for new upload
             if categorized_skills:
                 final_structured_data_to_save['skills'] = categorized_skills
@@ -138,8 +140,7 @@ async def upload_and_process_resume(
         elif use_saved_resume: # User is reusing an already saved resume
             print(f"DEBUG: Attempting to use saved resume for user {uid} for Optimizer.")
             
-            user_doc_ref = db.db.collection('users').document(uid)
-            user_doc = user_doc_ref.get()
+            user_doc = await db.get_user_doc(uid)
             if not user_doc.exists:
                 raise HTTPException(status_code=404, detail="User profile not found.")
             
@@ -168,12 +169,12 @@ async def upload_and_process_resume(
                 
             else: # Fallback: If structured data or skills are missing/invalid, regenerate from raw_text
                 print("DEBUG: Saved structured data or skills missing/invalid. Re-generating from raw text.")
-                final_structured_data_to_save = get_resume_structure(resume_text)
+                final_structured_data_to_save = await run_in_threadpool(get_resume_structure, resume_text)
                 structure_ai_called = True # AI call made
                 if not final_structured_data_to_save:
                     raise HTTPException(status_code=500, detail="AI failed to structure the saved resume from content.")
                 
-                categorized_skills = categorize_skills_from_text(resume_text)
+                categorized_skills = await run_in_threadpool(categorize_skills_from_text, resume_text)
                 skills_ai_called = True # AI call made
                 if categorized_skills:
                     final_structured_data_to_save['skills'] = categorized_skills
@@ -194,10 +195,10 @@ async def upload_and_process_resume(
         # we skip the heavy DB update.
         if file and file.filename: # This is a NEW upload, always perform full DB write
             print(f"DEBUG: Performing full db.update_resume_relational for new resume upload by user {uid}.")
-            success = db.update_resume_relational(user_uid=uid, parsed_data=final_structured_data_to_save)
+            success = await db.update_resume_relational_async(user_uid=uid, parsed_data=final_structured_data_to_save)
         elif structure_ai_called or skills_ai_called: # This is 'use saved', but data needed regeneration
             print(f"DEBUG: Performing full db.update_resume_relational for 'use saved' (data was regenerated) by user {uid}.")
-            success = db.update_resume_relational(user_uid=uid, parsed_data=final_structured_data_to_save)
+            success = await db.update_resume_relational_async(user_uid=uid, parsed_data=final_structured_data_to_save)
         else: # This is 'use saved', and data was fully reused (no AI calls needed)
             print(f"DEBUG: Skipping full db.update_resume_relational for 'use saved' (data fully reused). Only generating report.")
             success = True # Mark as successful operation as no DB error occurred
@@ -209,7 +210,7 @@ async def upload_and_process_resume(
 
         # --- Generate Full Resume Analysis Report (always generated for frontend display) ---
         print(f"DEBUG: Generating full resume analysis report for user {uid}.")
-        full_analysis_report = generate_full_resume_analysis(resume_text, job_description)
+        full_analysis_report = await run_in_threadpool(generate_full_resume_analysis, resume_text, job_description)
         if not full_analysis_report:
             logger.warning(f"WARNING: Full resume analysis returned empty results for user {uid}.")
             full_analysis_report = {
@@ -245,19 +246,19 @@ async def upload_and_process_resume(
         pass 
 
 @router.post("/optimize")
-async def optimize_resume(request_data: OptimizeRequest, user: dict = Depends(get_current_user),
+async def optimize_resume(request_data: OptimizeRequest, background_tasks: BackgroundTasks, user: dict = Depends(get_current_user),
                           db: DatabaseManager = Depends(get_db_manager)):
     uid = user['uid']
     
     try:
-        resume_to_optimize = db.fetch_resume_relational(uid, get_optimized=False)
+        resume_to_optimize = await db.fetch_resume_relational_async(uid, get_optimized=False)
         if not resume_to_optimize:
             raise HTTPException(status_code=404, detail="Resume not found for this user.")
         
-        optimized_data = optimize_resume_json(resume_to_optimize, request_data.user_request, job_description=request_data.job_description)
+        optimized_data = await run_in_threadpool(optimize_resume_json, resume_to_optimize, request_data.user_request, job_description=request_data.job_description)
         
-        db.update_optimized_resume_relational(uid, optimized_data)
-        db.record_resume_optimization(uid)
+        await run_in_threadpool(db.update_optimized_resume_relational, uid, optimized_data)
+        background_tasks.add_task(db.record_resume_optimization, uid) # Counter write runs after the response is sent
         
         return JSONResponse(content={
             "message": "Optimization successful",
@@ -274,11 +275,11 @@ async def optimize_linkedin_profile(request_data: OptimizeRequest, user: dict =
     uid = user['uid']
 
     try:
-        resume_data = db.fetch_resume_relational(uid, get_optimized=False)
+        resume_data = await db.fetch_resume_relational_async(uid, get_optimized=False)
         if not resume_data:
             raise HTTPException(status_code=404, detail="Resume not found for this user.")
         
-        linkedin_content = optimize_for_linkedin(resume_data, request_data.user_request, job_description=request_data.job_description)
+        linkedin_content = await run_in_threadpool(optimize_for_linkedin, resume_data, request_data.user_request, job_description=request_data.job_description)
         if not linkedin_content:
             raise HTTPException(status_code=500, detail="AI failed to generate LinkedIn content.")
         
@@ -296,7 +297,7 @@ async def download_resume(user_uid: str = Path(..., description="The UID of the
         raise HTTPException(status_code=403, detail="Not authorized to download this user's resume.")
 
     try:
-        final_data_for_doc = db.fetch_resume_relational(user_uid, get_optimized=True)
+        final_data_for_doc = await db.fetch_resume_relational_async(user_uid, get_optimized=True)
         if not final_data_for_doc:
             raise HTTPException(status_code=404, detail="Could not find optimized resume data for this user.")
         
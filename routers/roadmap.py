@@ -1,5 +1,8 @@
 # backend/routers/roadmap.py
 import sys
+import asyncio
+import logging
+from functools import lru_cache
 from pathlib import Path
 
 # IMPORTANT: Ensure the 'backend' directory is on sys.path for local development
@@ -8,18 +11,26 @@ backend_dir = current_file_dir.parent # Go up one level from 'routers' to 'backe
 if str(backend_dir) not in sys.path:
     sys.path.insert(0, str(backend_dir))
 
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from typing import Dict, Any, List
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ConfigDict, ValidationError, model_validator
+from typing import Dict, Any, List, Optional
 
 from core.db_core import DatabaseManager
-from core.ai_core import generate_career_roadmap, get_tutor_explanation, get_chatbot_response
-from dependencies import get_db_manager, get_current_user
+from core.ai_core import (
+    generate_career_roadmap, get_tutor_explanation, get_chatbot_response, stream_chatbot_response, to_sse_events,
+    get_cached_tutor_explanation, remember_tutor_explanation, tutor_topic_key,
+)
+from core.response_cache import ResponseCache, chat_cache_key
+from dependencies import get_db_manager, get_current_user, get_response_cache
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # --- Pydantic Models ---
 class RoadmapRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
     current_skills_input: str
     current_level: str
     goal_input: str
@@ -27,22 +38,72 @@ class RoadmapRequest(BaseModel):
     duration: str
     study_hours: str
 
+# Shape of the roadmap the client sends back as chatbot context. Validated once at parse time,
+# so the summarizer can use plain attribute access. Unknown keys (match score, timeline...) are ignored.
+class Topic(BaseModel):
+    name: Optional[str] = None # Stored roadmaps / Gemini output may have a null or missing name
+
+    @model_validator(mode="before")
+    @classmethod
+    def _from_bare_string(cls, data: Any) -> Any:
+        if data is None:
+            return {} # A null entry in the topics list
+        return {"name": data} if isinstance(data, str) else data # Older roadmaps store topics as plain strings
+
+class Phase(BaseModel):
+    phase_title: Optional[str] = "Unnamed Phase"
+    topics: List[Topic] = []
+
+class Project(BaseModel):
+    project_title: Optional[str] = "Untitled Project"
+
+class Course(BaseModel):
+    course_name: Optional[str] = "Unnamed Course"
+    platform: Optional[str] = "N/A"
+
+class CareerPlan(BaseModel):
+    skills_to_learn_summary: List[str] = []
+    detailed_roadmap: List[Phase] = []
+    suggested_projects: List[Project] = []
+    suggested_courses: List[Course] = []
+
 class ChatbotRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
     query: str
     history: List[Dict[str, str]]
-    career_plan: Dict[str, Any]
+    career_plan: CareerPlan
 
 class TutorRequest(BaseModel):
     topic: str
 
+class BatchTutorRequest(BaseModel):
+    topics: List[str]
+
 class TaskStatusUpdateRequest(BaseModel):
     phase_title: str
     topic_name: str
     is_completed: bool
+    phase_index: Optional[int] = None # Position in detailed_roadmap; disambiguates phases sharing a title
+
+class BatchOperation(BaseModel):
+    id: str
+    method: str
+    url: str # e.g. "/latest" or "/api/roadmap/update_task_status"
+    body: Optional[Dict[str, Any]] = None
+
+class BatchRequest(BaseModel):
+    requests: List[BatchOperation]
 
 # --- Helper Function ---
 def initialize_roadmap_progress(roadmap_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Ensures every topic in the detailed roadmap is a dictionary with progress."""
+    """
+    Ensures every topic in the detailed roadmap is a dictionary with progress.
+    The result is marked with '_progress_initialized' and saved that way by /generate,
+    so /latest skips the walk for any roadmap saved since; older roadmaps are normalized as before.
+    The marker is storage-only: endpoints drop it (_without_progress_marker) before responding.
+    """
+    if roadmap_data.get('_progress_initialized'):
+        return roadmap_data
     if 'detailed_roadmap' in roadmap_data and isinstance(roadmap_data['detailed_roadmap'], list):
         for phase in roadmap_data['detailed_roadmap']:
             if 'topics' in phase and isinstance(phase['topics'], list):
@@ -50,115 +111,182 @@ def initialize_roadmap_progress(roadmap_data: Dict[str, Any]) -> Dict[str, Any]:
                     {"name": topic, "is_completed": False} if isinstance(topic, str) else topic
                     for topic in phase['topics']
                 ]
+    roadmap_data['_progress_initialized'] = True
+    return roadmap_data
+
+def _without_progress_marker(roadmap_data: Dict[str, Any]) -> Dict[str, Any]:
+    roadmap_data.pop('_progress_initialized', None)
     return roadmap_data
 
 # --- API Endpoints ---
+# No per-endpoint try/except: unexpected errors reach the app-wide handler in main.py,
+# which logs them and returns a generic 500 (HTTPExceptions like the 404s keep their status).
 
 @router.post("/generate")
 async def generate_roadmap_endpoint(request: RoadmapRequest, user: dict = Depends(get_current_user), db: DatabaseManager = Depends(get_db_manager)):
     uid = user['uid']
-    try:
-        roadmap_output_raw = generate_career_roadmap(request.dict())
-        if not roadmap_output_raw:
-            raise HTTPException(status_code=500, detail="AI failed to generate a career roadmap.")
-        roadmap_output = initialize_roadmap_progress(roadmap_output_raw)
-        await db.save_user_roadmap(uid, roadmap_output)
-        db.record_roadmap_generation(uid)
-        return roadmap_output
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An internal server error occurred: {str(e)}")
+    roadmap_output_raw = await run_in_threadpool(generate_career_roadmap, request.model_dump())
+    if not roadmap_output_raw:
+        raise HTTPException(status_code=500, detail="AI failed to generate a career roadmap.")
+    roadmap_output = initialize_roadmap_progress(roadmap_output_raw)
+    await db.save_and_record_roadmap(uid, roadmap_output) # Roadmap + stats counter in one commit
+    return _without_progress_marker(roadmap_output)
 
 @router.get("/latest")
 async def get_latest_roadmap_endpoint(user: dict = Depends(get_current_user), db: DatabaseManager = Depends(get_db_manager)):
     uid = user['uid']
-    try:
-        roadmap = await db.get_user_roadmap(uid)
-        if not roadmap:
-            raise HTTPException(status_code=404, detail="No roadmap found for this user.")
-        return initialize_roadmap_progress(roadmap)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An internal server error occurred: {str(e)}")
+    roadmap = await db.get_user_roadmap(uid)
+    if not roadmap:
+        raise HTTPException(status_code=404, detail="No roadmap found for this user.")
+    return _without_progress_marker(initialize_roadmap_progress(roadmap))
 
 @router.post("/update_task_status")
 async def update_roadmap_task_status_endpoint(request: TaskStatusUpdateRequest, user: dict = Depends(get_current_user), db: DatabaseManager = Depends(get_db_manager)):
     uid = user['uid']
+    success = await db.update_roadmap_task_status(uid, request.phase_title, request.topic_name, request.is_completed, request.phase_index)
+    if not success:
+        raise HTTPException(status_code=404, detail="Task not found or could not be updated.")
+    return {"message": "Task status updated successfully."}
+
+# --- BATCH SECTION ---
+# Lets clients fold "/latest + several /update_task_status" into one HTTPS round trip.
+# Operations run concurrently and independently: don't rely on ordering within a batch.
+
+# Bounds one request's fan-out of concurrent Firestore operations.
+MAX_BATCH_OPERATIONS = 50
+
+async def _run_batch_operation(op: BatchOperation, user: dict, db: DatabaseManager) -> Dict[str, Any]:
+    path = op.url.split('?', 1)[0].removeprefix('/api/roadmap')
+    route = (op.method.upper(), path)
     try:
-        success = await db.update_roadmap_task_status(uid, request.phase_title, request.topic_name, request.is_completed)
-        if not success:
-            raise HTTPException(status_code=404, detail="Task not found or could not be updated.")
-        return {"message": "Task status updated successfully."}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An internal server error occurred: {str(e)}")
+        if route == ('GET', '/latest'):
+            body = await get_latest_roadmap_endpoint(user=user, db=db)
+        elif route == ('POST', '/update_task_status'):
+            body = await update_roadmap_task_status_endpoint(TaskStatusUpdateRequest(**(op.body or {})), user=user, db=db)
+        else:
+            return {"id": op.id, "status": 404, "body": {"detail": f"Unsupported batch operation: {op.method} {op.url}"}}
+        return {"id": op.id, "status": 200, "body": body}
+    except HTTPException as e:
+        return {"id": op.id, "status": e.status_code, "body": {"detail": e.detail}}
+    except ValidationError as e:
+        return {"id": op.id, "status": 422, "body": {"detail": e.errors(include_url=False)}}
+    except Exception:
+        # Mirrors the app-wide handler, but per operation so one failure doesn't sink the batch.
+        logger.exception("Unhandled error in roadmap batch operation %s %s", op.method, op.url)
+        return {"id": op.id, "status": 500, "body": {"detail": "Internal server error"}}
+
+@router.post("/batch")
+async def batch_roadmap_endpoint(request: BatchRequest, user: dict = Depends(get_current_user), db: DatabaseManager = Depends(get_db_manager)):
+    """Runs several roadmap operations in one request; returns one {id, status, body} per operation, in request order."""
+    if len(request.requests) > MAX_BATCH_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_OPERATIONS} operations per batch.")
+    results = await asyncio.gather(*(_run_batch_operation(op, user, db) for op in request.requests))
+    return {"responses": results}
+
+async def _get_tutor_explanation_cached(topic: str, db: DatabaseManager, background_tasks: BackgroundTasks) -> Optional[Dict[str, Any]]:
+    """In-process LRU, then the shared Firestore cache, then Gemini (whose result is written back to both)."""
+    explanation = get_cached_tutor_explanation(topic)
+    if explanation is not None:
+        return explanation
+    topic_key = tutor_topic_key(topic)
+    explanation = await db.get_cached_tutor_explanation(topic_key)
+    if explanation is not None:
+        remember_tutor_explanation(topic, explanation)
+        return explanation
+    explanation = await run_in_threadpool(get_tutor_explanation, topic)
+    if explanation:
+        background_tasks.add_task(db.save_tutor_explanation, topic_key, explanation)
+    return explanation
 
 @router.post("/tutor")
-async def get_tutor_response_endpoint(request: TutorRequest, user: dict = Depends(get_current_user)):
-    try:
-        tutor_response = get_tutor_explanation(request.topic)
-        if not tutor_response:
-            raise HTTPException(status_code=500, detail="AI tutor failed to provide an explanation.")
-        return tutor_response
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An internal server error occurred: {str(e)}")
+async def get_tutor_response_endpoint(request: TutorRequest, background_tasks: BackgroundTasks, user: dict = Depends(get_current_user), db: DatabaseManager = Depends(get_db_manager)):
+    tutor_response = await _get_tutor_explanation_cached(request.topic, db, background_tasks)
+    if not tutor_response:
+        raise HTTPException(status_code=500, detail="AI tutor failed to provide an explanation.")
+    return tutor_response
+
+# Bounds one request's fan-out of concurrent Gemini calls.
+MAX_BATCH_TUTOR_TOPICS = 20
+
+@router.post("/tutor/batch")
+async def get_tutor_batch_endpoint(request: BatchTutorRequest, background_tasks: BackgroundTasks, user: dict = Depends(get_current_user), db: DatabaseManager = Depends(get_db_manager)):
+    """
+    Explains several topics in one request, e.g. preloading a roadmap phase.
+    Topics are deduplicated by cache key and fetched concurrently, so N misses take about as long as the slowest one.
+    Returns {topic: explanation}, with null for topics the AI tutor failed on.
+    """
+    if len(request.topics) > MAX_BATCH_TUTOR_TOPICS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_TUTOR_TOPICS} topics per batch.")
+    unique_topics = {tutor_topic_key(topic): topic for topic in request.topics}
+    explanations = await asyncio.gather(*(
+        _get_tutor_explanation_cached(topic, db, background_tasks) for topic in unique_topics.values()
+    ))
+    by_key = dict(zip(unique_topics.keys(), explanations))
+    return {topic: by_key[tutor_topic_key(topic)] for topic in request.topics}
 
 # --- CHATBOT SECTION ---
 
-def _summarize_career_plan(plan: Dict[str, Any]) -> str:
+def _summarize_career_plan(plan: CareerPlan) -> str:
+    """Converts the validated career plan into a concise string summary for the AI."""
+    out = [] # Every line of the summary; joined once at the end
+
+    if plan.skills_to_learn_summary: out.append(f"**Priority Skills:** {', '.join(plan.skills_to_learn_summary)}")
+
+    if plan.detailed_roadmap:
+        out.append("\n**Learning Phases:**")
+        out.extend(
+            f"- **{phase.phase_title}**: Topics are {', '.join(topic.name for topic in phase.topics if topic.name)}."
+            for phase in plan.detailed_roadmap
+        )
+
+    if plan.suggested_projects:
+        out.append("\n**Suggested Projects:**")
+        out.extend(f"- {proj.project_title}" for proj in plan.suggested_projects)
+
+    if plan.suggested_courses:
+        out.append("\n**Recommended Courses:**")
+        out.extend(f"- '{course.course_name}' on {course.platform}." for course in plan.suggested_courses)
+
+    return "\n".join(out) if out else "No career plan details are available."
+
+@lru_cache(maxsize=256)
+def _summarize_career_plan_json(plan_json: str) -> str:
     """
-    Converts the detailed roadmap JSON into a concise and error-proof string summary for the AI.
-    This "bulletproof" version checks the type of each data section before processing it.
+    Memoized _summarize_career_plan keyed by the validated plan's JSON (model_dump_json()).
+    The plan is resent unchanged on every chatbot turn, so after the first turn this is a dict hit.
     """
-    if not isinstance(plan, dict):
-        return "Error: Career plan data is malformed."
-    parts = []
+    return _summarize_career_plan(CareerPlan.model_validate_json(plan_json))
+
+def _to_model_history(history: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """Normalizes the client's chat history into Gemini's format once, dropping empty messages."""
+    return [
+        {'role': 'user' if message.get('role') == 'user' else 'model', 'parts': [message['content']]}
+        for message in history if message.get('content')
+    ]
+
+@router.post("/chat")
+async def get_chatbot_response_endpoint(request: ChatbotRequest, user: dict = Depends(get_current_user), cache: ResponseCache = Depends(get_response_cache)):
+    plan_summary_str = _summarize_career_plan_json(request.career_plan.model_dump_json())
+
+    # Same plan + same question + same recent turns -> reuse the reply instead of calling Gemini.
+    cache_key = chat_cache_key(plan_summary_str, request.query, request.history)
+    cached_response = await cache.get(cache_key)
+    if cached_response is not None:
+        return cached_response
     
-    skills = plan.get('skills_to_learn_summary')
-    if isinstance(skills, list) and skills: parts.append(f"**Priority Skills:** {', '.join(skills)}")
+    # --- DIAGNOSTIC LOGGING --- (skipped cheaply unless LOG_LEVEL=DEBUG)
+    logger.debug("Chatbot pre-flight check: plan summary type passed to AI Core is %s (should be str).", type(plan_summary_str))
     
-    detailed_roadmap = plan.get('detailed_roadmap')
-    if isinstance(detailed_roadmap, list):
-        parts.append("\n**Learning Phases:**")
-        for phase in detailed_roadmap:
-            if not isinstance(phase, dict): continue
-            phase_title = phase.get('phase_title', 'Unnamed Phase')
-            topic_names = []
-            topics = phase.get('topics')
-            if isinstance(topics, list):
-                for topic in topics:
-                    if isinstance(topic, dict): topic_names.append(topic.get('name', ''))
-                    elif isinstance(topic, str): topic_names.append(topic)
-            valid_topic_names = [name for name in topic_names if name]
-            parts.append(f"- **{phase_title}**: Topics are {', '.join(valid_topic_names)}.")
-
-    suggested_projects = plan.get('suggested_projects')
-    if isinstance(suggested_projects, list):
-        parts.append("\n**Suggested Projects:**")
-        for proj in suggested_projects:
-             if isinstance(proj, dict): parts.append(f"- {proj.get('project_title', 'Untitled Project')}")
-
-    suggested_courses = plan.get('suggested_courses')
-    if isinstance(suggested_courses, list):
-        parts.append("\n**Recommended Courses:**")
-        for course in suggested_courses:
-            if isinstance(course, dict): parts.append(f"- '{course.get('course_name', 'Unnamed Course')}' on {course.get('platform', 'N/A')}.")
+    chatbot_response = await run_in_threadpool(get_chatbot_response, request.query, _to_model_history(request.history), plan_summary_str)
     
-    return "\n".join(parts) if parts else "No career plan details are available."
+    if not chatbot_response:
+        raise HTTPException(status_code=500, detail="AI chatbot failed to generate a response.")
+    await cache.set(cache_key, chatbot_response)
+    return chatbot_response
 
-@router.post("/chat")
-async def get_chatbot_response_endpoint(request: ChatbotRequest, user: dict = Depends(get_current_user)):
-    try:
-        plan_summary_str = _summarize_career_plan(request.career_plan)
-        
-        # --- DIAGNOSTIC LOGGING ---
-        print("\n--- Chatbot Pre-flight Check ---")
-        print(f"Type of data being passed to AI Core: {type(plan_summary_str)}")
-        print("This should be <class 'str'>.")
-        print("------------------------------\n")
-        
-        chatbot_response = get_chatbot_response(request.query, request.history, plan_summary_str)
-        
-        if not chatbot_response:
-            raise HTTPException(status_code=500, detail="AI chatbot failed to generate a response.")
-        return chatbot_response
-    except Exception as e:
-        print(f"❌ Chatbot Endpoint Error: {e}")
-        raise HTTPException(status_code=500, detail=f"An internal server error occurred: {str(e)}")
\ No newline at end of file
+@router.post("/chat/stream")
+async def get_chatbot_response_stream_endpoint(request: ChatbotRequest, user: dict = Depends(get_current_user)):
+    """Same as /chat, but the reply is streamed as Server-Sent Events (`data: {"text": ...}` chunks, then `data: [DONE]`)."""
+    plan_summary_str = _summarize_career_plan_json(request.career_plan.model_dump_json())
+    reply_chunks = stream_chatbot_response(request.query, _to_model_history(request.history), plan_summary_str)
+    return StreamingResponse(to_sse_events(reply_chunks), media_type="text/event-stream")
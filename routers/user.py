@@ -30,7 +30,7 @@ async def get_user_profile(
     try:
         uid = user['uid']
         
-        resume_data = db.fetch_resume_relational(user_uid=uid, get_optimized=False)
+        resume_data = await db.fetch_resume_relational_async(user_uid=uid, get_optimized=False)
         
         profile_response = {
             "uid": uid,
@@ -74,7 +74,7 @@ async def update_user_resume_details(
 
         # Now we call the database function with the correctly structured data.
         # It only expects uid and the data dictionary.
-        success = db.update_resume_relational(uid, data_to_save)
+        success = await db.update_resume_relational_async(uid, data_to_save)
         
         if not success:
             raise HTTPException(status_code=500, detail="Failed to update resume details in the database.")
@@ -94,18 +94,16 @@ async def get_user_stats(
 ):
     """Fetches dynamic statistics for the authenticated user."""
     uid = user['uid']
-    user_doc = db.db.collection('users').document(uid).get()
+    user_doc = await db.get_user_doc(uid)
 
     if not user_doc.exists:
         raise HTTPException(status_code=404, detail="User profile not found.")
     
     user_data = user_doc.to_dict()
-    # Safely get stats, defaulting to 0 if not present
-    stats = user_data.get('stats', {
-        'roadmaps_generated': 0,
-        'resumes_optimized': 0,
-        'assessments_taken': 0,
-        'jobs_matched': 0
-    })
+    # Safely get stats, defaulting each one to 0 if not present (stats are only written once incremented)
+    stats = dict(DatabaseManager.default_user_stats)
+    stored_stats = user_data.get('stats')
+    if isinstance(stored_stats, dict):
+        stats.update(stored_stats)
 
     return stats
\ No newline at end of file
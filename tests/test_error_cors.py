@@ -0,0 +1,36 @@
+# backend/tests/test_error_cors.py
+import os
+import sys
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+import pytest
+from fastapi.testclient import TestClient
+
+# core.ai_core exits at import time without a Gemini key; no Gemini call is made here.
+os.environ.setdefault("GEMINI_API_KEY_1", "test")
+from main import app
+
+ORIGIN = "https://iqras-gif.github.io"
+
+
+@pytest.fixture
+def failing_route():
+    async def boom():
+        raise RuntimeError("boom")
+
+    app.add_api_route("/_test/boom", boom)
+    yield "/_test/boom"
+    app.router.routes.pop()
+
+
+def test_unhandled_error_keeps_cors_header(failing_route):
+    # No `with` block: lifespan (Firebase init) is not needed for this route.
+    client = TestClient(app, raise_server_exceptions=False)
+    response = client.get(failing_route, headers={"Origin": ORIGIN})
+    assert response.status_code == 500
+    assert response.json() == {"detail": "Internal server error"}
+    assert response.headers["access-control-allow-origin"] == ORIGIN
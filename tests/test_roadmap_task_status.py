@@ -0,0 +1,48 @@
+# backend/tests/test_roadmap_task_status.py
+import sys
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+from core.db_core import DatabaseManager, _apply_task_status, _build_task_index, _find_task_phase
+
+DETAILED_ROADMAP = [
+    {'phase_title': 'Phase 1: Web Basics', 'topics': ['HTML', {'name': 'Node.js Intro', 'is_completed': False}]},
+    {'phase_title': 'Review', 'topics': ['Quiz']},
+    {'phase_title': 'Review', 'topics': ['Quiz']},
+]
+
+
+def test_task_status_field_quotes_index_dots_and_spaces():
+    field = DatabaseManager._task_status_field(0, 'Node.js Intro')
+    assert field == 'task_status.`0`.`Node.js Intro`'
+
+
+def test_task_index_lists_topic_names_per_phase():
+    assert _build_task_index(DETAILED_ROADMAP) == [
+        {'phase_title': 'Phase 1: Web Basics', 'topics': ['HTML', 'Node.js Intro']},
+        {'phase_title': 'Review', 'topics': ['Quiz']},
+        {'phase_title': 'Review', 'topics': ['Quiz']},
+    ]
+
+
+def test_find_task_phase_rejects_unknown_tasks():
+    task_index = _build_task_index(DETAILED_ROADMAP)
+    assert _find_task_phase(task_index, 'Phase 1: Web Basics', 'Node.js Intro') == 0
+    assert _find_task_phase(task_index, 'Phase 1: Web Basics', 'Missing Topic') is None
+    assert _find_task_phase(task_index, 'Review', 'Quiz', phase_index=2) == 2
+    assert _find_task_phase(task_index, 'Review', 'Quiz', phase_index=7) is None
+
+
+def test_status_overlay_keeps_phases_with_the_same_title_apart():
+    roadmap = {
+        'detailed_roadmap': [dict(phase, topics=list(phase['topics'])) for phase in DETAILED_ROADMAP],
+        'task_index': _build_task_index(DETAILED_ROADMAP),
+        'task_status': {'2': {'Quiz': True}},
+    }
+    result = _apply_task_status(roadmap)
+    assert 'task_status' not in result and 'task_index' not in result
+    assert result['detailed_roadmap'][1]['topics'] == ['Quiz']
+    assert result['detailed_roadmap'][2]['topics'] == [{'name': 'Quiz', 'is_completed': True}]